@@ -0,0 +1,117 @@
+"""
+Fake fibre device standing in for an ODrive connected over USB, for running the serial model without hardware.
+Property paths are mapped onto a SimulatedAxis, every property access costs a configurable USB round trip, and
+install() makes the devices visible to the module's discovery as if the odrive library had found them.
+"""
+
+from typing import Any, Iterable
+import concurrent.futures
+import enum
+import time
+
+import odrive
+
+from .simulator import SimulatedAxis, TORQUE_CONSTANT, VBUS_VOLTAGE
+
+DEFAULT_LATENCY = 0.0005
+CURRENT_LIMIT = 10.0
+
+# property path -> SimulatedAxis attribute
+AXIS_PROPERTIES = {
+    "axis0.current_state": "axis_state",
+    "axis0.active_errors": "axis_error",
+    "axis0.disarm_reason": "axis_error",
+    "axis0.controller.input_pos": "input_pos",
+    "axis0.controller.input_vel": "input_vel",
+    "axis0.controller.input_torque": "input_torque",
+    "axis0.controller.trajectory_done": "trajectory_done",
+    "axis0.controller.config.control_mode": "control_mode",
+    "axis0.controller.config.input_mode": "input_mode",
+    "axis0.trap_traj.config.vel_limit": "traj_vel_limit",
+    "axis0.pos_vel_mapper.pos_rel": "position",
+    "axis0.pos_vel_mapper.vel": "velocity",
+    "axis0.motor.foc.Iq_setpoint": "iq_setpoint",
+}
+
+
+class _Endpoint:
+    def __init__(self, device: "FakeODrive", path: str):
+        object.__setattr__(self, "_device", device)
+        object.__setattr__(self, "_path", path)
+
+    def __getattr__(self, name: str) -> Any:
+        return self._device.read(self._path + name)
+
+    def __setattr__(self, name: str, value: Any):
+        self._device.write(self._path + name, value)
+
+
+class FakeODrive(_Endpoint):
+    def __init__(self, serial_number: int = 0x3867326F3433, latency: float = DEFAULT_LATENCY):
+        super().__init__(self, "")
+        object.__setattr__(self, "axis", SimulatedAxis())
+        object.__setattr__(self, "latency", latency)
+        object.__setattr__(self, "serial_number", serial_number)
+        # set by the odrive library's discovery on real devices
+        object.__setattr__(self, "_serial_number", "{:08X}".format(serial_number))
+        object.__setattr__(self, "transfers", 0)
+        object.__setattr__(self, "values", {
+            "vbus_voltage": VBUS_VOLTAGE,
+            "axis0.config.motor.torque_constant": TORQUE_CONSTANT,
+            "axis0.config.general_lockin.current": CURRENT_LIMIT,
+            "axis0.config.can.node_id": 0,
+        })
+        known = list(AXIS_PROPERTIES) + list(self.values) + ["axis0.requested_state"]
+        object.__setattr__(self, "_objects", {path[:i] for path in known for i, c in enumerate(path) if c == "."})
+
+    def clear_errors(self):
+        self._transfer()
+        self.axis.axis_error = 0
+
+    def read(self, path: str) -> Any:
+        if path in self._objects:
+            return _Endpoint(self, path + ".")
+        self._transfer()
+        if path in AXIS_PROPERTIES:
+            self.axis.step()
+            return getattr(self.axis, AXIS_PROPERTIES[path])
+        if path in self.values:
+            return self.values[path]
+        raise AttributeError(path)
+
+    def write(self, path: str, value: Any):
+        self._transfer()
+        # fibre sends enum properties as their integer value; ControlMode and InputMode are not IntEnums
+        if isinstance(value, enum.Enum):
+            value = value.value
+        self.axis.step()
+        if path == "axis0.requested_state":
+            self.axis.request_state(value)
+        elif path == "axis0.controller.input_pos":
+            self.axis.set_input_pos(value)
+        elif path in AXIS_PROPERTIES:
+            setattr(self.axis, AXIS_PROPERTIES[path], value)
+        else:
+            self.values[path] = value
+
+    def _transfer(self):
+        object.__setattr__(self, "transfers", self.transfers + 1)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+
+def install(devices: Iterable[FakeODrive]):
+    """Report devices as connected to the odrive library, and keep it from starting its USB discovery thread."""
+    odrive.start_discovery = lambda path: None
+    odrive.connected_devices.extend(devices)
+    signal = odrive.connected_devices_changed
+    odrive.connected_devices_changed = concurrent.futures.Future()
+    signal.set_result(None)
+
+
+def uninstall(devices: Iterable[FakeODrive]):
+    for device in devices:
+        odrive.connected_devices.remove(device)
+    signal = odrive.connected_devices_changed
+    odrive.connected_devices_changed = concurrent.futures.Future()
+    signal.set_result(None)
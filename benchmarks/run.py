@@ -0,0 +1,216 @@
+"""
+Benchmarks for the canbus and serial motor models against simulated ODrives. For each number of nodes and
+encoder estimate rate it measures the latency of get_position, set_rpm and go_for, set_rpm throughput across all
+motors, and the CPU the module spends per axis. It also measures how long a fresh interpreter takes to import the
+module's entry point and each model, and to load the CANSimple codec, then compares the results with a stored baseline.
+
+    python -m benchmarks.run                    # run, compare with benchmarks/baseline.json, exit 1 on regression
+    python -m benchmarks.run --save-baseline    # run and store the results as the new baseline
+
+Baselines are machine specific, so record one on the machine that checks for regressions.
+"""
+
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from google.protobuf.struct_pb2 import Struct
+from viam.proto.app.robot import ComponentConfig
+
+from odrivemotor.src.odriveCAN.odriveCAN import OdriveCAN
+from odrivemotor.src.odriveSerial.odriveSerial import OdriveSerial
+
+from . import fake_fibre
+from .simulator import CANSimpleSimulator
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CHANNEL = "odrive-bench"
+DEFAULT_TOLERANCE = 0.5
+# differences below these are noise whatever the relative change, by metric unit suffix
+ABSOLUTE_SLACK = {"_us": 50.0, "_pct": 0.5, "_cps": 0.0}
+GO_FOR_REVOLUTIONS = 1000.0
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# (setup, timed statement) of each import measurement, run in a fresh interpreter
+IMPORTS = {
+    "main": ("", "import odrivemotor.src.main"),
+    "canbus": ("", "import odrivemotor.src.odriveCAN.odriveCAN"),
+    "serial": ("", "import odrivemotor.src.odriveSerial.odriveSerial"),
+    "codec": ("from odrivemotor.src.odriveCAN.codec import load_codec", "load_codec()"),
+}
+TIMED_STATEMENT = ("import sys, time; exec(sys.argv[1]); started = time.perf_counter(); exec(sys.argv[2]); "
+                   "print((time.perf_counter() - started) * 1e6)")
+
+
+def component_config(name: str, attributes: Dict[str, Any]) -> ComponentConfig:
+    struct = Struct()
+    struct.update(attributes)
+    return ComponentConfig(name=name, attributes=struct)
+
+
+async def latency(samples: int, call) -> Dict[str, float]:
+    await call(0)
+    durations = []
+    for i in range(samples):
+        started = time.perf_counter()
+        await call(i)
+        durations.append((time.perf_counter() - started) * 1e6)
+    durations.sort()
+    return {"p50_us": statistics.median(durations), "p99_us": durations[int(len(durations) * 0.99) - 1]}
+
+
+async def throughput(motors: List[Any], duration: float) -> float:
+    deadline = time.perf_counter() + duration
+    calls = 0
+
+    async def drive(motor):
+        nonlocal calls
+        i = 0
+        while time.perf_counter() < deadline:
+            await motor.set_rpm(60 + i % 2)
+            calls += 1
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[drive(motor) for motor in motors])
+    return calls / (time.perf_counter() - started)
+
+
+async def cpu_per_axis(nodes: int, window: float, simulator_cpu) -> float:
+    """Percent of one core the module uses per axis while idle, excluding the simulator's own thread."""
+    process, simulator, started = time.process_time(), simulator_cpu(), time.perf_counter()
+    await asyncio.sleep(window)
+    used = (time.process_time() - process) - (simulator_cpu() - simulator)
+    return used / (time.perf_counter() - started) / nodes * 100
+
+
+async def measure(prefix: str, motors: List[Any], samples: int, duration: float, extra: Dict[str, Any], results: Dict[str, float]):
+    motor = motors[0]
+    for name, call in [
+        ("get_position", lambda i: motor.get_position()),
+        ("set_rpm", lambda i: motor.set_rpm(60 + i % 2)),
+        ("go_for", lambda i: motor.go_for(60 + i % 2, GO_FOR_REVOLUTIONS, extra)),
+    ]:
+        for key, value in (await latency(samples, call)).items():
+            results[f"{prefix}.{name}.{key}"] = value
+    results[f"{prefix}.set_rpm.throughput_cps"] = await throughput(motors, duration)
+    for m in motors:
+        await m.stop()
+
+
+async def bench_can(nodes: int, rate: float, args, results: Dict[str, float]):
+    with CANSimpleSimulator(range(1, nodes + 1), CHANNEL, "virtual", heartbeat_rate=args.heartbeat_rate, encoder_rate=rate) as simulator:
+        motors = [OdriveCAN.new(component_config(f"can{node}", {"canbus_channel": CHANNEL, "canbus_interface": "virtual",
+                                                                "canbus_node_id": node}), {})
+                  for node in range(1, nodes + 1)]
+        await asyncio.sleep(max(0.2, 3 / args.heartbeat_rate))
+        prefix = f"can.nodes{nodes}.rate{rate:g}"
+        results[f"{prefix}.cpu_per_axis_pct"] = await cpu_per_axis(nodes, args.cpu_window, lambda: simulator.cpu_time)
+        await measure(prefix, motors, args.samples, args.duration, {}, results)
+        for motor in motors:
+            await motor.close()
+
+
+async def bench_serial(nodes: int, args, results: Dict[str, float]):
+    devices = [fake_fibre.FakeODrive(0x3867326F3400 + node, args.usb_latency) for node in range(nodes)]
+    fake_fibre.install(devices)
+    try:
+        motors = [OdriveSerial.new(component_config(f"serial{node}", {"serial_number": device._serial_number}), {})
+                  for node, device in enumerate(devices)]
+        for motor in motors:
+            await motor.wait_until_connected()
+        await asyncio.sleep(0.2)
+        prefix = f"serial.nodes{nodes}"
+        results[f"{prefix}.cpu_per_axis_pct"] = await cpu_per_axis(nodes, args.cpu_window, lambda: 0.0)
+        await measure(prefix, motors, args.samples, args.duration, {"wait": False}, results)
+        for motor in motors:
+            await motor.close()
+    finally:
+        fake_fibre.uninstall(devices)
+
+
+def bench_imports(runs: int, results: Dict[str, float]):
+    """Median time of each import in a new interpreter, which sees the same cold module cache as a module start."""
+    for name, (setup, statement) in IMPORTS.items():
+        durations = [float(subprocess.run([sys.executable, "-c", TIMED_STATEMENT, setup, statement], cwd=ROOT, check=True,
+                                          capture_output=True, text=True).stdout.split()[-1])
+                     for _ in range(runs)]
+        results[f"import.{name}_us"] = statistics.median(durations)
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = []
+    for key, value in results.items():
+        if key not in baseline:
+            continue
+        reference = baseline[key]
+        slack = next((slack for suffix, slack in ABSOLUTE_SLACK.items() if key.endswith(suffix)), 0.0)
+        # throughput regresses when it falls, everything else when it rises
+        if key.endswith("_cps"):
+            regressed = value < reference * (1 - tolerance) - slack
+        else:
+            regressed = value > reference * (1 + tolerance) + slack
+        if regressed:
+            regressions.append(f"{key}: {value:.1f} (baseline {reference:.1f})")
+    return regressions
+
+
+async def run(args) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    if args.import_runs > 0:
+        print(f"imports: {args.import_runs} runs each", file=sys.stderr)
+        bench_imports(args.import_runs, results)
+    for nodes in args.nodes:
+        for rate in args.rates:
+            print(f"canbus: {nodes} nodes, encoder estimates at {rate:g} Hz", file=sys.stderr)
+            await bench_can(nodes, rate, args, results)
+    for nodes in args.serial_nodes:
+        print(f"serial: {nodes} devices", file=sys.stderr)
+        await bench_serial(nodes, args, results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    numbers = lambda kind: lambda value: [kind(v) for v in value.split(",") if v]
+    parser.add_argument("--nodes", type=numbers(int), default=[1, 4, 8, 16, 32], help="canbus node counts")
+    parser.add_argument("--rates", type=numbers(float), default=[100.0, 500.0], help="encoder estimate rates in Hz")
+    parser.add_argument("--heartbeat-rate", type=float, default=10.0)
+    parser.add_argument("--serial-nodes", type=numbers(int), default=[1, 4], help="serial device counts")
+    parser.add_argument("--usb-latency", type=float, default=fake_fibre.DEFAULT_LATENCY, help="seconds per fake USB transfer")
+    parser.add_argument("--samples", type=int, default=200, help="calls per latency measurement")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per throughput measurement")
+    parser.add_argument("--import-runs", type=int, default=5, help="fresh interpreters per import measurement, 0 to skip")
+    parser.add_argument("--cpu-window", type=float, default=1.0, help="seconds per CPU measurement")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}", file=sys.stderr)
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to record one", file=sys.stderr)
+        return
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Simulated ODrives that speak CANSimple, as described by odrive-cansimple.dbc, on a python-can bus. One thread
+serves every simulated node: it broadcasts heartbeats, encoder estimates, Iq and bus voltage at configurable rates,
+answers remote (RTR) requests for them, and follows state, controller mode and setpoint commands with a simple
+motion model. Run it on the `virtual` interface to benchmark the canbus models in process, or on a vcan interface.
+"""
+
+from typing import Dict, Iterable, Optional
+import threading
+import time
+
+import can
+
+from odrivemotor.src.odriveCAN.codec import load_codec, NODE_ID_SHIFT, CMD_ID_MASK
+
+IDLE = 1
+CLOSED_LOOP_CONTROL = 8
+TORQUE_CONTROL = 1
+VELOCITY_CONTROL = 2
+POSITION_CONTROL = 3
+TRAP_TRAJ = 5
+# passthrough position setpoints are tracked at this speed, in turns/s
+POSITION_TRACKING_SPEED = 50.0
+TORQUE_CONSTANT = 0.1
+INERTIA = 0.01
+VBUS_VOLTAGE = 24.0
+
+
+class SimulatedAxis:
+    """Controller state and motion model of one axis. Shared with the fake fibre device used for serial benchmarks."""
+
+    def __init__(self, node_id: int = 0, state_delay: float = 0.0):
+        self.node_id = node_id
+        self.state_delay = state_delay
+        self.axis_state = IDLE
+        self.axis_error = 0
+        self.control_mode = POSITION_CONTROL
+        self.input_mode = 1
+        self.input_pos = 0.0
+        self.input_vel = 0.0
+        self.input_torque = 0.0
+        self.traj_vel_limit = 2.0
+        self.position = 0.0
+        self.velocity = 0.0
+        self.trajectory_done = True
+        self._requested_state = None
+        self._requested_at = 0.0
+        self._stepped_at = time.monotonic()
+
+    @property
+    def iq_setpoint(self) -> float:
+        return self.input_torque / TORQUE_CONSTANT if self.control_mode == TORQUE_CONTROL else 0.0
+
+    def request_state(self, state: int):
+        if state == CLOSED_LOOP_CONTROL and self.axis_error == 0:
+            self._requested_state = state
+            self._requested_at = time.monotonic()
+        elif state == IDLE:
+            self._requested_state = None
+            self.axis_state = IDLE
+            self.velocity = 0.0
+
+    def set_input_pos(self, position: float):
+        self.input_pos = position
+        self.trajectory_done = False
+
+    def fault(self, error: int):
+        """Latch an error and drop to idle, as the firmware does."""
+        self.axis_error |= error
+        self.request_state(IDLE)
+
+    def step(self):
+        now = time.monotonic()
+        dt = now - self._stepped_at
+        self._stepped_at = now
+        if self._requested_state is not None and now - self._requested_at >= self.state_delay:
+            self.axis_state = self._requested_state
+            self._requested_state = None
+        if self.axis_state != CLOSED_LOOP_CONTROL:
+            self.velocity = 0.0
+            return
+        if self.control_mode == POSITION_CONTROL:
+            speed = self.traj_vel_limit if self.input_mode == TRAP_TRAJ else POSITION_TRACKING_SPEED
+            remaining = self.input_pos - self.position
+            move = max(-speed * dt, min(speed * dt, remaining))
+            self.position += move
+            self.velocity = move / dt if dt > 0 else 0.0
+            if self.position == self.input_pos:
+                self.trajectory_done = True
+        elif self.control_mode == VELOCITY_CONTROL:
+            self.velocity = self.input_vel
+            self.position += self.velocity * dt
+        elif self.control_mode == TORQUE_CONTROL:
+            self.velocity += self.input_torque / INERTIA * dt
+            self.position += self.velocity * dt
+
+
+class CANSimpleSimulator:
+    """Simulated ODrives on one CAN channel. Rates are in Hz; a rate of 0 disables that broadcast, in which case the
+    message is only sent in reply to a remote request."""
+
+    def __init__(self, node_ids: Iterable[int], channel: str = "odrive-sim", interface: str = "virtual",
+                 heartbeat_rate: float = 10.0, encoder_rate: float = 100.0, iq_rate: float = 0.0, vbus_rate: float = 0.0,
+                 state_delay: float = 0.0):
+        self.codec = load_codec()
+        self.axes: Dict[int, SimulatedAxis] = {node_id: SimulatedAxis(node_id, state_delay) for node_id in node_ids}
+        self.bus = can.Bus(channel, interface=interface)
+        self.rates = {'Heartbeat': heartbeat_rate, 'Get_Encoder_Estimates': encoder_rate, 'Get_Iq': iq_rate,
+                      'Get_Vbus_Voltage': vbus_rate}
+        self.frames_sent = 0
+        # CPU time used by the simulator thread, so benchmarks can subtract it from the process' CPU time
+        self.cpu_time = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="odrive-sim", daemon=True)
+        self._handlers = {
+            'Set_Axis_State': lambda axis, data: axis.request_state(data['Axis_Requested_State']),
+            'Set_Controller_Mode': self._on_controller_mode,
+            'Set_Input_Pos': lambda axis, data: axis.set_input_pos(data['Input_Pos']),
+            'Set_Input_Vel': lambda axis, data: setattr(axis, 'input_vel', data['Input_Vel']),
+            'Set_Input_Torque': lambda axis, data: setattr(axis, 'input_torque', data['Input_Torque']),
+            'Set_Traj_Vel_Limit': lambda axis, data: setattr(axis, 'traj_vel_limit', data['Traj_Vel_Limit']),
+            'Clear_Errors': lambda axis, data: setattr(axis, 'axis_error', 0),
+            'Estop': lambda axis, data: axis.fault(0x800),
+            'Set_Axis_Node_ID': self._on_node_id,
+        }
+
+    def start(self) -> "CANSimpleSimulator":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.bus.shutdown()
+
+    def __enter__(self) -> "CANSimpleSimulator":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        periods = {name: 1.0 / rate for name, rate in self.rates.items() if rate > 0}
+        due = {name: time.monotonic() for name in periods}
+        while not self._stopped.is_set():
+            timeout = max(0.0, min(due.values()) - time.monotonic()) if due else 0.1
+            msg = self.bus.recv(timeout)
+            while msg is not None:
+                self._on_message(msg)
+                msg = self.bus.recv(0)
+            now = time.monotonic()
+            for name, period in periods.items():
+                if now >= due[name]:
+                    for axis in self.axes.values():
+                        axis.step()
+                        self._send(axis, name)
+                    # a simulator that fell behind skips ahead rather than bursting to catch up
+                    due[name] = max(due[name] + period, now)
+            self.cpu_time = time.thread_time()
+
+    def _on_message(self, msg: can.Message):
+        axis = self.axes.get(msg.arbitration_id >> NODE_ID_SHIFT)
+        message = self.codec.by_cmd_id.get(msg.arbitration_id & CMD_ID_MASK)
+        if axis is None or message is None:
+            return
+        axis.step()
+        if msg.is_remote_frame:
+            if message.name in self.rates or message.name in ('Get_Motor_Error', 'Get_Encoder_Error', 'Get_Sensorless_Error'):
+                self._send(axis, message.name)
+            return
+        handler = self._handlers.get(message.name)
+        if handler is not None:
+            handler(axis, message.decode(msg.data) if message.length else {})
+
+    def _on_controller_mode(self, axis: SimulatedAxis, data):
+        axis.control_mode = data['Control_Mode']
+        axis.input_mode = data['Input_Mode']
+
+    def _on_node_id(self, axis: SimulatedAxis, data):
+        del self.axes[axis.node_id]
+        axis.node_id = data['Axis_Node_ID']
+        self.axes[axis.node_id] = axis
+
+    def _payload(self, axis: SimulatedAxis, name: str) -> Optional[dict]:
+        if name == 'Heartbeat':
+            # firmware 0.6 reports the trajectory done flag in the byte the legacy DBC names Encoder_Flags
+            return {'Axis_Error': axis.axis_error, 'Axis_State': axis.axis_state, 'Motor_Flags': 0,
+                    'Encoder_Flags': int(axis.trajectory_done), 'Controller_Flags': 0}
+        if name == 'Get_Encoder_Estimates':
+            return {'Pos_Estimate': axis.position, 'Vel_Estimate': axis.velocity}
+        if name == 'Get_Iq':
+            return {'Iq_Setpoint': axis.iq_setpoint, 'Iq_Measured': axis.iq_setpoint}
+        if name == 'Get_Vbus_Voltage':
+            return {'Vbus_Voltage': VBUS_VOLTAGE}
+        if name == 'Get_Motor_Error':
+            return {'Motor_Error': 0}
+        if name == 'Get_Encoder_Error':
+            return {'Encoder_Error': 0}
+        if name == 'Get_Sensorless_Error':
+            return {'Sensorless_Error': 0}
+        return None
+
+    def _send(self, axis: SimulatedAxis, name: str):
+        message = self.codec[name]
+        self.bus.send(can.Message(arbitration_id=(axis.node_id << NODE_ID_SHIFT) | message.cmd_id, is_extended_id=False,
+                                  data=message.encode(self._payload(axis, name))))
+        self.frames_sent += 1
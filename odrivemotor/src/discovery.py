@@ -0,0 +1,73 @@
+"""
+Process-wide ODrive discovery. The odrive library's USB discovery thread is started once and the devices it reports
+are indexed by serial number, so every component looks its ODrive up from the same index and connects concurrently
+instead of blocking module startup in find_any() one after another. odrive is only imported once discovery is
+first used, so importing this module for its constants does not load the USB stack.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+
+DEFAULT_CONNECT_TIMEOUT = 30.0
+# applying a config file is slow and blocking, so ODrives are configured on their own threads rather than holding
+# up the executor that serves telemetry polls
+CONNECT_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="odrive-connect")
+
+# (odrive.connected_devices_changed when the index was built, serial number -> device)
+_index: Tuple[Any, Dict[str, Any]] = (None, {})
+
+
+def normalize_serial_number(serial_number: str) -> str:
+    """Serial numbers are matched as the upper case hex string odrivetool prints, without zero padding."""
+    serial_number = serial_number.strip().upper()
+    if serial_number.startswith("0X"):
+        serial_number = serial_number[2:]
+    return serial_number.lstrip("0")
+
+
+def connected_devices() -> Dict[str, Any]:
+    """Connected ODrives by serial number. Rebuilt only when the discovery thread reports a change."""
+    import odrive
+    global _index
+    signal = odrive.connected_devices_changed
+    if _index[0] is not signal:
+        _index = (signal, {normalize_serial_number(device._serial_number): device for device in list(odrive.connected_devices)})
+    return _index[1]
+
+
+async def find_odrive(serial_number: str = "", timeout: Optional[float] = DEFAULT_CONNECT_TIMEOUT) -> Any:
+    """Wait for the ODrive with serial_number, or any ODrive when it is empty. Raises TimeoutError."""
+    import odrive
+    odrive.start_discovery(odrive.default_search_path)
+    key = normalize_serial_number(serial_number)
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        signal = odrive.connected_devices_changed
+        devices = connected_devices()
+        if key in devices:
+            return devices[key]
+        if key == "" and devices:
+            return next(iter(devices.values()))
+        # the signal future is shared with the discovery thread and every other waiter, so it must not be cancelled
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(signal)), None if deadline is None else deadline - loop.time())
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"no ODrive with serial number '{serial_number}' found after {timeout} seconds") from None
+
+
+async def connect_odrive(serial_number: str, configure: Callable[[Any], Any],
+                         timeout: Optional[float] = DEFAULT_CONNECT_TIMEOUT) -> Tuple[Any, Any]:
+    """Find an ODrive and run the blocking configure(odrv) on a connect thread, both within timeout.
+    Returns the device and what configure returned. Raises TimeoutError."""
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    odrv = await find_odrive(serial_number, timeout)
+    try:
+        result = await asyncio.wait_for(loop.run_in_executor(CONNECT_EXECUTOR, functools.partial(configure, odrv)),
+                                        None if deadline is None else max(0.0, deadline - loop.time()))
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"configuring ODrive '{serial_number}' did not finish after {timeout} seconds") from None
+    return odrv, result
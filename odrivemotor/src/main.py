@@ -2,9 +2,12 @@ import asyncio
 import sys
 
 from viam.components.motor import Motor
+from viam.components.generic import Generic
 from viam.module.module import Module
-from .odriveSerial.odriveSerial import OdriveSerial
-from .odriveCAN.odriveCAN import OdriveCAN
+# the model packages only register their models; each implementation is imported by its first component
+from .odriveSerial import MODEL as SERIAL_MODEL
+from .odriveCAN import MODEL as CANBUS_MODEL
+from .odriveCANGroup import MODEL as CANBUS_GROUP_MODEL
 
 async def main():
     """This function creates and starts a new module, after adding all desired resources.
@@ -13,8 +16,9 @@ async def main():
         address (str): The address to serve the module on
     """
     module = Module.from_args()
-    module.add_model_from_registry(Motor.SUBTYPE, OdriveCAN.MODEL)
-    module.add_model_from_registry(Motor.SUBTYPE, OdriveSerial.MODEL)
+    module.add_model_from_registry(Motor.SUBTYPE, CANBUS_MODEL)
+    module.add_model_from_registry(Motor.SUBTYPE, SERIAL_MODEL)
+    module.add_model_from_registry(Generic.SUBTYPE, CANBUS_GROUP_MODEL)
     await module.start()
 
 if __name__ == "__main__":
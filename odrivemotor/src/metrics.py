@@ -0,0 +1,111 @@
+"""
+Counters and latency histograms for the ODrive models. Recording is off by default, and every recording call
+returns after a single check of the registry's enabled flag, so instrumented hot paths cost next to nothing
+until metrics are turned on.
+"""
+
+from typing import Any, Callable, Dict, List
+import bisect
+import functools
+import math
+import time
+
+# histogram bucket upper bounds in seconds, the last one catching everything slower
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, math.inf)
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    count: int
+    total: float
+    max: float
+    buckets: List[int]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """Estimate of the given percentile, interpolated within the bucket that holds it."""
+        rank = self.count * percent / 100
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "max": self.max}
+        snapshot.update({f"p{percent}": self.percentile(percent) for percent in PERCENTILES})
+        snapshot["buckets"] = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, self.buckets) if count}
+        return snapshot
+
+
+class Metrics:
+    enabled: bool
+    counters: Dict[str, int]
+    histograms: Dict[str, Histogram]
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+        self._reset_at = time.monotonic()
+
+    def increment(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters with their mean rate per second since the last reset, and histogram summaries in seconds."""
+        elapsed = time.monotonic() - self._reset_at
+        return {
+            "enabled": self.enabled,
+            "elapsed": elapsed,
+            "counters": dict(self.counters),
+            "rates": {name: count / elapsed for name, count in self.counters.items()} if elapsed > 0 else {},
+            "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+
+def timed(method: Callable) -> Callable:
+    """Record the latency of an async component method under 'api.<method name>' in the component's metrics."""
+    name = f"api.{method.__name__}"
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return await method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            metrics.observe(name, time.perf_counter() - started)
+    return wrapper
@@ -1,9 +1,11 @@
 """
-This files OdriveCAN model with the Viam Registry.
+This files OdriveCAN model with the Viam Registry. The model is imported when the first canbus component is created.
 """
 
-from viam.resource.registry import Registry, ResourceCreatorRegistration
+from viam.resource.types import Model, ModelFamily
 from viam.components.motor import Motor
-from .odriveCAN import OdriveCAN
+from ..registration import register_lazily
 
-Registry.register_resource_creator(Motor.SUBTYPE, OdriveCAN.MODEL, ResourceCreatorRegistration(OdriveCAN.new, OdriveCAN.validate))
+MODEL = Model(ModelFamily("viam", "odrive"), "canbus")
+
+register_lazily(Motor.SUBTYPE, MODEL, __name__ + ".odriveCAN", "OdriveCAN")
@@ -0,0 +1,151 @@
+"""
+CAN bus bandwidth planning. Every canbus motor registers the cyclic message rates from its odrive_config_file
+with the interface it is on, so that the load of all nodes on a bus can be compared with its baud rate, and the
+rates stretched to fit a target utilisation, lowest priority messages first.
+"""
+
+from typing import Any, Dict, List, Optional
+from threading import Lock
+import json
+import math
+import os
+
+RATE_PREFIX = "axis0.config.can."
+# cyclic messages in priority order, highest first. Each is sent as an 8 byte frame.
+CYCLIC_MESSAGES = ["heartbeat", "encoder", "error", "iq", "bus_voltage", "torques", "temperature", "powers", "version"]
+# slowest period in ms the planner may give these messages; any other message may be turned off (period 0)
+MAX_PERIODS = {"heartbeat": 500, "encoder": 1000}
+FRAME_BYTES = 8
+DEFAULT_TARGET_UTILIZATION = 0.7
+
+
+def frame_bits(length: int = FRAME_BYTES) -> int:
+    """Worst case length in bits of a standard id data frame on the wire, including stuff bits."""
+    return 47 + 8 * length + (34 + 8 * length - 1) // 4
+
+
+FRAME_BITS = frame_bits()
+
+# channel -> node id -> {"periods": message -> period in ms, "config_file": path}
+_nodes: Dict[str, Dict[int, Dict[str, Any]]] = {}
+_nodes_lock = Lock()
+
+
+def rate_key(message: str) -> str:
+    return f"{RATE_PREFIX}{message}_msg_rate_ms"
+
+
+def read_periods(flat_config: Dict[str, Any]) -> Dict[str, int]:
+    """Cyclic message periods in ms from a flattened odrivetool config. 0 means the message is not broadcast."""
+    return {message: int(flat_config.get(rate_key(message)) or 0) for message in CYCLIC_MESSAGES if rate_key(message) in flat_config}
+
+
+def load(periods: Dict[str, int]) -> float:
+    """Bits per second one node's cyclic messages put on the bus."""
+    return sum(FRAME_BITS * 1000 / period for period in periods.values() if period > 0)
+
+
+def register_node(channel: str, node_id: int, periods: Dict[str, int], config_file: str):
+    with _nodes_lock:
+        _nodes.setdefault(channel, {})[node_id] = {"periods": periods, "config_file": config_file}
+
+
+def unregister_node(channel: str, node_id: int):
+    with _nodes_lock:
+        _nodes.get(channel, {}).pop(node_id, None)
+
+
+def fit(periods: Dict[int, Dict[str, int]], budget: float) -> Dict[int, Dict[str, int]]:
+    """Stretch the periods of every node until their load fits in budget bits per second, starting with the lowest
+    priority message. A message is slowed down by the same factor on every node, and turned off if even that is not
+    enough unless it has a maximum period."""
+    proposed = {node_id: dict(node_periods) for node_id, node_periods in periods.items()}
+    excess = sum(load(node_periods) for node_periods in proposed.values()) - budget
+    for message in reversed(CYCLIC_MESSAGES):
+        if excess <= 0:
+            break
+        sending = [node_periods for node_periods in proposed.values() if node_periods.get(message, 0) > 0]
+        contribution = sum(FRAME_BITS * 1000 / node_periods[message] for node_periods in sending)
+        if not sending:
+            continue
+        if contribution <= excess and message not in MAX_PERIODS:
+            for node_periods in sending:
+                node_periods[message] = 0
+            excess -= contribution
+            continue
+        reduced = 0.0
+        for node_periods in sending:
+            period = node_periods[message]
+            stretched = MAX_PERIODS[message] if contribution <= excess else math.ceil(period * contribution / (contribution - excess))
+            if message in MAX_PERIODS:
+                stretched = max(period, min(stretched, MAX_PERIODS[message]))
+            node_periods[message] = stretched
+            reduced += FRAME_BITS * 1000 / period - FRAME_BITS * 1000 / stretched
+        excess -= reduced
+    return proposed
+
+
+def plan(channel: str, baud_rate: int, target: float = DEFAULT_TARGET_UTILIZATION) -> Dict[str, Any]:
+    """Bus load of every node registered on channel, and the periods that would bring it under target utilisation."""
+    with _nodes_lock:
+        nodes = {node_id: dict(node["periods"]) for node_id, node in _nodes.get(channel, {}).items()}
+    load_bps = sum(load(periods) for periods in nodes.values())
+    proposed = fit(nodes, target * baud_rate)
+    proposed_bps = sum(load(periods) for periods in proposed.values())
+    return {
+        "channel": channel,
+        "baud_rate": baud_rate,
+        "frame_bits": FRAME_BITS,
+        "target_utilization": target,
+        "load_bps": load_bps,
+        "utilization": load_bps / baud_rate,
+        "oversubscribed": load_bps > target * baud_rate,
+        "nodes": {str(node_id): {"periods_ms": periods, "load_bps": load(periods)} for node_id, periods in nodes.items()},
+        "proposed": {str(node_id): {message: period for message, period in periods.items() if period != nodes[node_id][message]}
+                     for node_id, periods in proposed.items() if periods != nodes[node_id]},
+        "proposed_utilization": proposed_bps / baud_rate,
+    }
+
+
+def apply_plan(channel: str, proposed: Dict[str, Dict[str, int]]) -> List[str]:
+    """Write proposed periods into the config files of the nodes they are for, and return the files rewritten. Nodes
+    sharing a file get the slowest proposed period of each message. Blocking."""
+    by_file: Dict[str, Dict[str, int]] = {}
+    with _nodes_lock:
+        nodes = _nodes.get(channel, {})
+        for node_id, periods in proposed.items():
+            node = nodes.get(int(node_id))
+            if node is None:
+                continue
+            merged = by_file.setdefault(node["config_file"], {})
+            for message, period in periods.items():
+                previous = merged.get(message)
+                merged[message] = period if previous is None else (0 if 0 in (previous, period) else max(previous, period))
+            node["periods"] = {**node["periods"], **periods}
+    for path, periods in by_file.items():
+        write_periods(path, periods)
+    return list(by_file)
+
+
+def write_periods(config_path: str, periods: Dict[str, int]):
+    """Rewrite *_msg_rate_ms values in an odrivetool config file, in its flat or nested layout."""
+    with open(config_path) as json_file:
+        content = json_file.read()
+    config = json.loads(content)
+    for message, period in periods.items():
+        key = rate_key(message)
+        if key in config:
+            config[key] = period
+            continue
+        parent = config
+        *path, name = key.split(".")
+        for part in path:
+            parent = parent.setdefault(part, {})
+        parent[name] = period
+    indent: Optional[int] = 2 if content.startswith("{\n") else None
+    temporary = config_path + ".tmp"
+    with open(temporary, "w") as json_file:
+        json.dump(config, json_file, indent=indent)
+        if content.endswith("\n"):
+            json_file.write("\n")
+    os.replace(temporary, config_path)
@@ -0,0 +1,133 @@
+"""
+CANSimple codec compiled once per process from odrive-cansimple.dbc. Every message in the DBC is
+little-endian and byte aligned, so each one is packed and unpacked with a single precompiled struct.
+The compiled messages are cached as JSON in the module's data directory, so cantools is only imported
+to parse a DBC that has not been compiled before.
+"""
+
+from typing import Any, Dict, List, Tuple
+from pathlib import Path
+import functools
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+DBC_PATH = str(Path(__file__).resolve().parents[2] / "odrive-cansimple.dbc")
+
+# CANSimple arbitration ids are (node_id << 5) | cmd_id
+NODE_ID_SHIFT = 5
+CMD_ID_MASK = 0x1F
+# part of the cache file name, so a cache written in another layout is compiled again rather than misread. Bump it
+# whenever the compiled message tuple changes.
+COMPILED_FORMAT_VERSION = 1
+
+# (length in bits, is_float, is_signed) -> struct format character
+_FORMATS = {
+    (8, False, False): 'B', (8, False, True): 'b',
+    (16, False, False): 'H', (16, False, True): 'h',
+    (32, False, False): 'I', (32, False, True): 'i',
+    (32, True, False): 'f', (32, True, True): 'f',
+    (64, True, False): 'd', (64, True, True): 'd',
+}
+
+
+class MessageCodec:
+    name: str
+    cmd_id: int
+    length: int
+    signals: List[str]
+
+    def __init__(self, name: str, cmd_id: int, length: int, fmt: str, signals: List[Tuple[str, float, float, bool]]):
+        self.name = name
+        self.cmd_id = cmd_id
+        self.length = length
+        self.signals = [signal[0] for signal in signals]
+        self._struct = struct.Struct(fmt)
+        # signals with a scale or offset, as (index, name, scale, offset, is_integer)
+        self._scaled = [(i, name, scale, offset, is_integer) for i, (name, scale, offset, is_integer) in enumerate(signals)
+                        if scale != 1 or offset != 0]
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        values = [data[name] for name in self.signals]
+        for i, name, scale, offset, is_integer in self._scaled:
+            value = (values[i] - offset) / scale
+            values[i] = round(value) if is_integer else value
+        return self._struct.pack(*values)
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        values = self._struct.unpack_from(payload)
+        decoded = dict(zip(self.signals, values))
+        for i, name, scale, offset, is_integer in self._scaled:
+            decoded[name] = values[i] * scale + offset
+        return decoded
+
+
+# (name, cmd_id, length, struct format, signals), the arguments of MessageCodec
+CompiledMessage = Tuple[str, int, int, str, List[Tuple[str, float, float, bool]]]
+
+
+def _compile_message(message) -> CompiledMessage:
+    fmt = '<'
+    position = 0
+    signals = []
+    for signal in sorted(message.signals, key=lambda s: s.start):
+        key = (signal.length, signal.is_float, signal.is_signed)
+        if signal.byte_order != 'little_endian' or signal.start % 8 != 0 or key not in _FORMATS:
+            raise ValueError(f"{message.name}.{signal.name} is not a byte aligned little-endian signal")
+        fmt += 'x' * (signal.start // 8 - position)
+        fmt += _FORMATS[key]
+        position = (signal.start + signal.length) // 8
+        signals.append((signal.name, signal.scale, signal.offset, not signal.is_float))
+    fmt += 'x' * (message.length - position)
+    return message.name, message.frame_id, message.length, fmt, signals
+
+
+class CANSimpleCodec:
+    messages: Dict[str, MessageCodec]
+    by_cmd_id: Dict[int, MessageCodec]
+
+    def __init__(self, messages: List[MessageCodec]):
+        self.messages = {message.name: message for message in messages}
+        self.by_cmd_id = {message.cmd_id: message for message in messages}
+
+    def __getitem__(self, name: str) -> MessageCodec:
+        return self.messages[name]
+
+    @functools.lru_cache(maxsize=None)
+    def arbitration_ids(self, node_id: int) -> Dict[str, int]:
+        """Arbitration id of every message for node_id. The returned table is shared and must not be modified."""
+        return {name: (node_id << NODE_ID_SHIFT) | message.cmd_id for name, message in self.messages.items()}
+
+
+def compiled_cache_path(dbc: bytes) -> str:
+    digest = hashlib.sha256(dbc).hexdigest()[:16]
+    return os.path.join(os.environ.get("VIAM_MODULE_DATA", tempfile.gettempdir()), f"odrive-cansimple-v{COMPILED_FORMAT_VERSION}-{digest}.json")
+
+
+def compile_dbc(path: str) -> List[CompiledMessage]:
+    import cantools
+    db = cantools.database.load_file(path)
+    return [_compile_message(message) for message in db.messages]
+
+
+@functools.lru_cache(maxsize=None)
+def load_codec(path: str = DBC_PATH) -> CANSimpleCodec:
+    """Compile the DBC's messages, or read them from the cache when this DBC was compiled before. Cached, so the
+    DBC is read once per process."""
+    with open(path, "rb") as dbc_file:
+        cache_path = compiled_cache_path(dbc_file.read())
+    try:
+        with open(cache_path) as cache_file:
+            compiled = json.load(cache_file)
+    except (OSError, ValueError):
+        compiled = compile_dbc(path)
+        # the cache only saves time, so a data directory that cannot be written is not an error
+        try:
+            with open(cache_path + ".tmp", "w") as cache_file:
+                json.dump(compiled, cache_file)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass
+    return CANSimpleCodec([MessageCodec(*message) for message in compiled])
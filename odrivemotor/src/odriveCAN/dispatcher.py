@@ -0,0 +1,255 @@
+"""
+Shared CAN receive dispatcher. One background reader per CAN interface decodes each frame once
+and routes it to the subscribers registered for its (node_id, cmd_id).
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future
+from threading import Lock, Thread
+import asyncio
+import time
+
+from viam.logging import getLogger
+
+import can
+
+from .codec import load_codec, CANSimpleCodec, NODE_ID_SHIFT, CMD_ID_MASK
+from ..metrics import Metrics
+from ..scheduler import EXECUTOR
+
+LOGGER = getLogger(__name__)
+STANDARD_ID_MASK = 0x7FF
+# python-can treats an empty filter list as "receive everything", so an idle bus filters on an id nothing sends
+MATCH_NOTHING_FILTERS = [{"can_id": 0x0, "can_mask": 0x1FFFFFFF, "extended": True}]
+# how often an idle reader checks whether it should stop, which bounds how long closing an interface takes
+READER_TIMEOUT = 0.1
+# a reader that stopped on an interface error is restarted after a delay that doubles while it keeps failing
+RESTART_MIN_DELAY = 0.1
+RESTART_MAX_DELAY = 5.0
+
+# called with the decoded signals and the time.time() the frame was received at
+Callback = Callable[[Dict[str, Any], float], None]
+
+_dispatchers: Dict[Tuple[str, str], "CANDispatcher"] = {}
+_dispatchers_lock = Lock()
+
+
+def get_dispatcher(channel: str = "can0", interface: str = "socketcan") -> "CANDispatcher":
+    """Return the dispatcher for a CAN interface, opening it on first use so that all motors share it. Every call
+    must be matched by a release_dispatcher() once the caller is done with it."""
+    with _dispatchers_lock:
+        key = (channel, interface)
+        if key not in _dispatchers:
+            _dispatchers[key] = CANDispatcher(channel, interface)
+        dispatcher = _dispatchers[key]
+        dispatcher.references += 1
+        return dispatcher
+
+
+def release_dispatcher(dispatcher: "CANDispatcher") -> Optional[Future]:
+    """Drop a reference taken by get_dispatcher(). The last one closes the interface on the blocking executor, since
+    stopping the reader thread takes up to READER_TIMEOUT, and returns the future of that shutdown."""
+    with _dispatchers_lock:
+        dispatcher.references -= 1
+        if dispatcher.references > 0:
+            return None
+        if _dispatchers.get((dispatcher.channel, dispatcher.interface)) is dispatcher:
+            del _dispatchers[(dispatcher.channel, dispatcher.interface)]
+    return EXECUTOR.submit(dispatcher.shutdown)
+
+
+class CANDispatcher(can.Listener):
+    channel: str
+    interface: str
+    bus: Any
+    codec: CANSimpleCodec
+    metrics: Metrics
+    references: int
+
+    def __init__(self, channel: str, interface: str):
+        self.channel = channel
+        self.interface = interface
+        self.references = 0
+        self.bus = can.Bus(channel, interface=interface)
+        self.codec = load_codec()
+        # shared by every component on this interface
+        self.metrics = Metrics()
+        self._subscribers: Dict[Tuple[int, int], List[Callback]] = {}
+        self._lock = Lock()
+        self._send_lock = Lock()
+        self._failed_callbacks = set()
+        self._shadows: Dict[int, Dict[str, Any]] = {}
+        self._reader_lock = Lock()
+        self._closed = False
+        self._restart_delay = RESTART_MIN_DELAY
+        self._update_filters()
+        self._notifier = can.Notifier(self.bus, [self], timeout=READER_TIMEOUT)
+        self._reader_started_at = time.monotonic()
+
+    def shutdown(self):
+        """Stop the reader thread and close the interface. Pending waits time out."""
+        with self._reader_lock:
+            self._closed = True
+            self._notifier.stop()
+            self.bus.shutdown()
+
+    def on_message_received(self, msg: can.Message):
+        if msg.is_error_frame:
+            self.metrics.increment("bus_error_frames")
+            return
+        if msg.is_remote_frame:
+            return
+        self.metrics.increment("rx_frames")
+        cmd_id = msg.arbitration_id & CMD_ID_MASK
+        callbacks = self._subscribers.get((msg.arbitration_id >> NODE_ID_SHIFT, cmd_id))
+        if not callbacks:
+            self.metrics.increment("rx_unsubscribed")
+            return
+        try:
+            decoded = self.codec.by_cmd_id[cmd_id].decode(msg.data)
+        except Exception:
+            self.metrics.increment("rx_dropped")
+            return
+        # msg.timestamp is the wall clock on some interfaces and time since boot or since the interface was opened
+        # on others, so frames are stamped with the host's clock for comparing against time.time()
+        received_at = time.time()
+        # an exception escaping here would end the reader thread for every component on the interface
+        for callback in callbacks:
+            try:
+                callback(decoded, received_at)
+            except Exception as e:
+                self.metrics.increment("reader_errors")
+                # logged once per subscriber, since a broken one fails on every frame
+                if callback not in self._failed_callbacks:
+                    self._failed_callbacks.add(callback)
+                    LOGGER.error(f"CAN subscriber for node {msg.arbitration_id >> NODE_ID_SHIFT} failed: {e}")
+
+    # Called on the reader thread, which python-can ends after any exception from the interface. The interface is
+    # reopened and a new reader started on a thread of its own, backing off while it keeps failing.
+    def on_error(self, exc: Exception):
+        self.metrics.increment("reader_errors")
+        if time.monotonic() - self._reader_started_at > RESTART_MAX_DELAY:
+            self._restart_delay = RESTART_MIN_DELAY
+        delay = self._restart_delay
+        self._restart_delay = min(delay * 2, RESTART_MAX_DELAY)
+        LOGGER.error(f"CAN reader on {self.channel} stopped: {exc}. Restarting it in {delay} seconds")
+        Thread(target=self._restart_reader, args=(delay,), name=f"can-restart-{self.channel}", daemon=True).start()
+
+    def _restart_reader(self, delay: float):
+        while True:
+            time.sleep(delay)
+            with self._reader_lock:
+                if self._closed:
+                    return
+                try:
+                    self._reopen()
+                except Exception as e:
+                    delay = min(delay * 2, RESTART_MAX_DELAY)
+                    LOGGER.error(f"Could not reopen CAN interface {self.channel}: {e}. Retrying in {delay} seconds")
+                    continue
+            self.metrics.increment("reader_restarts")
+            LOGGER.info(f"CAN reader on {self.channel} restarted")
+            return
+
+    def _reopen(self):
+        # the old reader thread has already ended, so stopping its notifier does not wait
+        self._notifier.stop(timeout=READER_TIMEOUT)
+        try:
+            self.bus.shutdown()
+        except Exception as e:
+            LOGGER.warning(f"Could not close CAN interface {self.channel}: {e}")
+        bus = can.Bus(self.channel, interface=self.interface)
+        # periodic tasks started on the old bus end with it; senders see CanError until the swap
+        with self._lock, self._send_lock:
+            self.bus = bus
+            self._update_filters()
+        self._notifier = can.Notifier(self.bus, [self], timeout=READER_TIMEOUT)
+        self._reader_started_at = time.monotonic()
+
+    def shadow(self, node_id: int) -> Dict[str, Any]:
+        """The controller configuration last sent to node_id. It is kept here rather than on a component so that
+        every component commanding the node sees, and clears, the same one."""
+        return self._shadows.setdefault(node_id, {})
+
+    def clear_shadow(self, node_id: int):
+        self._shadows.pop(node_id, None)
+
+    def subscribe(self, node_id: int, cmd_id: int, callback: Callback):
+        # the reader thread iterates the lists without locking, so they are replaced rather than mutated
+        with self._lock:
+            key = (node_id, cmd_id)
+            is_new_key = key not in self._subscribers
+            self._subscribers[key] = self._subscribers.get(key, []) + [callback]
+            if is_new_key:
+                self._update_filters()
+
+    def unsubscribe(self, node_id: int, cmd_id: int, callback: Callback):
+        with self._lock:
+            key = (node_id, cmd_id)
+            callbacks = [c for c in self._subscribers.get(key, []) if c is not callback]
+            if callbacks:
+                self._subscribers[key] = callbacks
+            elif self._subscribers.pop(key, None) is not None:
+                self._update_filters()
+
+    def _update_filters(self):
+        # on socketcan the filters are installed in the kernel, so frames that no axis consumes never wake the reader
+        filters = [{"can_id": (node_id << NODE_ID_SHIFT) | cmd_id, "can_mask": STANDARD_ID_MASK, "extended": False}
+                   for node_id, cmd_id in self._subscribers]
+        self.bus.set_filters(filters or MATCH_NOTHING_FILTERS)
+
+    async def wait_for(self, node_id: int, cmd_id: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next frame from node_id with cmd_id and return its decoded signals, or None on timeout."""
+        return await self._next_frame(node_id, cmd_id, timeout)
+
+    async def request(self, node_id: int, cmd_id: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Send a remote (RTR) request for cmd_id to node_id and return the decoded reply, or None if none arrives
+        before timeout. The first frame of the message after the request answers it, whether it is the reply or a
+        cyclic broadcast. Raises can.CanError if the request cannot be sent."""
+        request = can.Message(arbitration_id=(node_id << NODE_ID_SHIFT) | cmd_id, is_extended_id=False,
+                              is_remote_frame=True, dlc=self.codec.by_cmd_id[cmd_id].length)
+        return await self._next_frame(node_id, cmd_id, timeout, request)
+
+    async def _next_frame(self, node_id: int, cmd_id: int, timeout: Optional[float],
+                          request: Optional[can.Message] = None) -> Optional[Dict[str, Any]]:
+        # every call has its own future and deadline, resolved by the first matching frame after it subscribed
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(decoded):
+            if not future.done():
+                future.set_result(decoded)
+
+        def callback(decoded, timestamp):
+            loop.call_soon_threadsafe(resolve, decoded)
+
+        self.subscribe(node_id, cmd_id, callback)
+        try:
+            if request is not None:
+                self.send(request)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.unsubscribe(node_id, cmd_id, callback)
+
+    def send(self, msg: can.Message):
+        with self._send_lock:
+            self._send(msg)
+
+    def send_periodic(self, msg: can.Message, period: float) -> can.ModifiableCyclicTaskABC:
+        return self.bus.send_periodic(msg, period, store_task=False)
+
+    def send_burst(self, msgs: List[can.Message]):
+        """Queue msgs back-to-back so they go out on the wire without gaps between them."""
+        with self._send_lock:
+            for msg in msgs:
+                self._send(msg)
+
+    def _send(self, msg: can.Message):
+        try:
+            self.bus.send(msg)
+        except can.CanError:
+            self.metrics.increment("tx_errors")
+            raise
+        self.metrics.increment("tx_frames")
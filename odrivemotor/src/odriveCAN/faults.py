@@ -0,0 +1,109 @@
+"""
+Fault detection for one ODrive axis. Every heartbeat is checked on the CAN reader thread as it arrives, and a new
+axis error is answered from that thread with the frame the reaction policy calls for, before anything is scheduled
+on the event loop, so the ODrive is told within one heartbeat period of reporting the error.
+"""
+
+from typing import Any, Callable, Deque, Dict, List, Optional
+from collections import deque
+import asyncio
+import time
+
+from .telemetry import AxisTelemetry, HEARTBEAT
+
+# policy -> (message, payload) sent as soon as a new axis error is seen. hold sends nothing and leaves the axis as
+# the firmware left it.
+FAULT_POLICIES = {
+    "idle": ('Set_Axis_State', {'Axis_Requested_State': 0x01}),
+    "estop": ('Estop', {}),
+    "hold": None,
+}
+DEFAULT_FAULT_POLICY = "idle"
+DEFAULT_FAULT_HISTORY = 100
+# Axis_Error bits as named by odrive.enums.ODriveError, kept here so that canbus motors do not import odrive
+AXIS_ERRORS = {
+    0x1: "INITIALIZING",
+    0x2: "SYSTEM_LEVEL",
+    0x4: "TIMING_ERROR",
+    0x8: "MISSING_ESTIMATE",
+    0x10: "BAD_CONFIG",
+    0x20: "DRV_FAULT",
+    0x40: "MISSING_INPUT",
+    0x100: "DC_BUS_OVER_VOLTAGE",
+    0x200: "DC_BUS_UNDER_VOLTAGE",
+    0x400: "DC_BUS_OVER_CURRENT",
+    0x800: "DC_BUS_OVER_REGEN_CURRENT",
+    0x1000: "CURRENT_LIMIT_VIOLATION",
+    0x2000: "MOTOR_OVER_TEMP",
+    0x4000: "INVERTER_OVER_TEMP",
+    0x8000: "VELOCITY_LIMIT_VIOLATION",
+    0x10000: "POSITION_LIMIT_VIOLATION",
+    0x1000000: "WATCHDOG_TIMER_EXPIRED",
+    0x2000000: "ESTOP_REQUESTED",
+    0x4000000: "SPINOUT_DETECTED",
+    0x8000000: "OTHER_DEVICE_FAILED",
+    0x40000000: "CALIBRATION_ERROR",
+}
+
+Fault = Dict[str, Any]
+
+
+def error_name(errors: int) -> str:
+    """The names of the bits set in an Axis_Error, joined with | as ODriveError does. Unknown bits are shown in hex."""
+    names = [name for bit, name in AXIS_ERRORS.items() if errors & bit]
+    unknown = errors & ~sum(AXIS_ERRORS)
+    if unknown:
+        names.append(hex(unknown))
+    return "|".join(names)
+
+
+class FaultMonitor:
+    policy: str
+    history: Deque[Fault]
+
+    def __init__(self, telemetry: AxisTelemetry, send: Callable[[str, Dict[str, Any]], None], on_fault: Callable[[Fault], None],
+                 policy: str = DEFAULT_FAULT_POLICY, history_size: int = DEFAULT_FAULT_HISTORY):
+        self.policy = policy
+        self.history = deque(maxlen=history_size)
+        self._telemetry = telemetry
+        self._send = send
+        self._on_fault = on_fault
+        self._faulted = False
+        self._loop = asyncio.get_running_loop()
+
+    @property
+    def faulted(self) -> bool:
+        return self._faulted
+
+    def attach(self):
+        self._telemetry.add_listener(self.check)
+
+    def detach(self):
+        self._telemetry.remove_listener(self.check)
+
+    def resize(self, history_size: int):
+        if history_size != self.history.maxlen:
+            self.history = deque(self.history, maxlen=history_size)
+
+    def check(self):
+        """Called by the telemetry store on every update, from the CAN reader thread."""
+        errors = self._telemetry.axis_error
+        if not errors:
+            self._faulted = False
+            return
+        if self._faulted:
+            return
+        self._faulted = True
+        policy = self.policy
+        reaction = FAULT_POLICIES[policy]
+        if reaction is not None:
+            self._send(*reaction)
+        detected_at = self._telemetry.timestamps[HEARTBEAT]
+        fault = {"time": detected_at, "axis_error": errors, "policy": policy, "reaction_latency": time.time() - detected_at}
+        self.history.append(fault)
+        self._loop.call_soon_threadsafe(self._on_fault, fault)
+
+    def snapshot(self, limit: Optional[int] = None) -> List[Fault]:
+        """The newest limit faults, oldest first."""
+        faults = list(self.history)
+        return faults[-limit:] if limit else faults
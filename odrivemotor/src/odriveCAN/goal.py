@@ -0,0 +1,58 @@
+"""
+Completion tracking for position moves, resolved from the telemetry stream as frames arrive. The tolerances are
+shared with the serial model, so this module does not import python-can at runtime.
+"""
+
+from typing import Optional, TYPE_CHECKING
+import asyncio
+
+if TYPE_CHECKING:
+    from .telemetry import AxisTelemetry
+
+GOAL_POSITION_TOLERANCE = 0.01
+GOAL_VELOCITY_TOLERANCE = 0.05
+
+
+class MoveGoal:
+    position: float
+
+    def __init__(self, telemetry: "AxisTelemetry", position: float,
+                 position_tolerance: float = GOAL_POSITION_TOLERANCE, velocity_tolerance: float = GOAL_VELOCITY_TOLERANCE):
+        self.position = position
+        self._telemetry = telemetry
+        self._position_tolerance = position_tolerance
+        self._velocity_tolerance = velocity_tolerance
+        # the trajectory done flag still reads as set from the previous move until the ODrive starts this one,
+        # so it only counts once it has been seen cleared
+        self._trajectory_started = False
+        self._reached = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def check(self):
+        """Called by the telemetry store on every update, from the CAN reader thread."""
+        if self._reached:
+            return
+        telemetry = self._telemetry
+        if telemetry.trajectory_done is False:
+            self._trajectory_started = True
+        reached = (telemetry.position is not None and telemetry.velocity is not None
+                   and abs(telemetry.position - self.position) < self._position_tolerance
+                   and abs(telemetry.velocity) < self._velocity_tolerance)
+        if reached or (self._trajectory_started and telemetry.trajectory_done):
+            self._reached = True
+            self._loop.call_soon_threadsafe(self._resolve, True)
+
+    def cancel(self):
+        self._loop.call_soon_threadsafe(self._resolve, False)
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Return True once the goal is reached, or False if it was cancelled or timed out first."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    def _resolve(self, reached: bool):
+        if not self._future.done():
+            self._future.set_result(reached)
@@ -1,4 +1,4 @@
-from typing import ClassVar, Mapping, Any, Dict, Optional, Tuple, List
+from typing import ClassVar, Mapping, Any, Dict, Optional, Tuple, List, Union
 
 from typing_extensions import Self
 
@@ -6,103 +6,126 @@ from viam.module.types import Reconfigurable
 from viam.proto.app.robot import ComponentConfig
 from viam.proto.common import ResourceName, Geometry
 from viam.resource.base import ResourceBase
-from viam.resource.types import Model, ModelFamily
+from viam.resource.types import Model
 
 from viam.components.motor import Motor
 from viam.logging import getLogger
 
-import odrive
-from odrive.enums import *
-from threading import Thread
 import asyncio
+import json
+import os
+import tempfile
 import time
 import math
-from ..utils import set_configs, find_baudrate, rsetattr, find_axis_configs
-from pathlib import Path
+from . import MODEL
+from ..utils import set_configs, find_baudrate, parse_baud_rate, rsetattr, find_axis_configs, load_config
+from ..scheduler import PeriodicScheduler, run_blocking
+from ..discovery import DEFAULT_CONNECT_TIMEOUT
+from ..metrics import Metrics, timed
+from .dispatcher import get_dispatcher, release_dispatcher, CANDispatcher
+from .codec import CANSimpleCodec
+from .telemetry import AxisTelemetry, HEARTBEAT, CLOSED_LOOP_CONTROL, ENCODER_ESTIMATES, IQ, MOTOR_ERROR, ENCODER_ERROR, SENSORLESS_ERROR, REQUESTABLE
+from .goal import MoveGoal
+from .stream import SetpointStream, STREAM_MODES, DEFAULT_STREAM_RATE, STREAM_TIMEOUT_CHECKS
+from .trajectory import TrajectoryStream, parse_waypoints, parse_rate, plan_profile
+from .recorder import AxisRecorder, DEFAULT_RECORD_CAPACITY
+from .faults import FaultMonitor, error_name, FAULT_POLICIES, DEFAULT_FAULT_POLICY, DEFAULT_FAULT_HISTORY
+from . import bandwidth
 
 import can
-import cantools
 
 LOGGER = getLogger(__name__)
 MINUTE_TO_SECOND = 60.0
+MESSAGE_TIMEOUT = 1.0
+DEFAULT_ERROR_CHECK_PERIOD = 1.0
+DEFAULT_CHANNEL = "can0"
+DEFAULT_INTERFACE = "socketcan"
+DEFAULT_SNAPSHOT_SAMPLES = 100
+DEFAULT_BAUD_RATE = 250000
 
 class OdriveCAN(Motor, Reconfigurable):
-    MODEL: ClassVar[Model] = Model(ModelFamily("viam", "odrive"), "canbus")
+    MODEL: ClassVar[Model] = MODEL
     odrive_config_file: str
     offset: float
-    baud_rate: str
+    baud_rate: int
     odrv: Any
+    connect_timeout: float
     nodeID: int
     torque_constant: float
     current_limit: float
-    goal: dict()
+    goal: Optional[MoveGoal]
+    stream: Optional[Union[SetpointStream, TrajectoryStream]]
+    recorder: Optional[AxisRecorder]
+    metrics: Metrics
+    telemetry_max_age: Optional[float]
     serial_number: str
-    db: Any
-    bus: Any
+    connection: Optional[asyncio.Task]
+    codec: CANSimpleCodec
+    arbitration_ids: Dict[str, int]
+    dispatcher: CANDispatcher
+    telemetry: AxisTelemetry
+    faults: FaultMonitor
+    heartbeat_lost: bool
+    attached_at: float
+    scheduler: PeriodicScheduler
+    error_check_period: float
+    closed: bool
 
     @classmethod
     def new(cls, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]) -> Self:
         odriveCAN = cls(config.name)
-        odriveCAN.bus = can.Bus("can0", bustype="socketcan")
-        odriveCAN.odrive_config_file = config.attributes.fields["odrive_config_file"].string_value
+        odriveCAN.closed = False
+        # everything release() undoes exists before the dispatcher is taken, so a failure at any later step can be
+        # cleaned up
         if ("canbus_node_id" not in config.attributes.fields) or (config.attributes.fields["canbus_node_id"].number_value < 0):
             LOGGER.error("non negative 'canbus_node_id' is a required config attribute")
         odriveCAN.nodeID = int(config.attributes.fields["canbus_node_id"].number_value)
-        odriveCAN.serial_number = config.attributes.fields["serial_number"].string_value
-        odriveCAN.torque_constant = 1
-        odriveCAN.current_limit = 10
-        odriveCAN.offset = 0.0
-        odriveCAN.goal = {"position": 0.0, "active": False}
-
-        path = str(Path().absolute()) + "/odrivemotor/odrive-cansimple.dbc"
-        odriveCAN.db = cantools.database.load_file(path)
-
-        if odriveCAN.odrive_config_file != "":
-            if odriveCAN.serial_number == "":
-                LOGGER.info("If you are using multiple Odrive controllers, make sure to add their respective serial_number to each component attributes")
-            try:
-                odriveCAN.odrv = odrive.find_any() if odriveCAN.serial_number == "" else odrive.find_any(serial_number = odriveCAN.serial_number)
-                odriveCAN.odrv.clear_errors()
-                if odriveCAN.odrive_config_file != "":
-                    set_configs(odriveCAN.odrv, odriveCAN.odrive_config_file)
-                    rsetattr(odriveCAN.odrv, "axis0.config.can.node_id", odriveCAN.nodeID)
-                    odriveCAN.torque_constant = find_axis_configs(odriveCAN.odrive_config_file, ["motor", "torque_constant"])
-                    odriveCAN.current_limit = find_axis_configs(odriveCAN.odrive_config_file, ["general_lockin", "current"])
-            except:
-                LOGGER.error("Could not set odrive configurations because no serial odrive connection was found.")
-                pass
-
-        if config.attributes.fields["canbus_baud_rate"].string_value != "":
-            baud_rate = config.attributes.fields["canbus_baud_rate"].string_value
-            baud_rate = baud_rate.replace("k", "000")
-            baud_rate = baud_rate.replace("K", "000")
-            odriveCAN.baud_rate = baud_rate
-        elif odriveCAN.odrive_config_file != "":
-            baud_rate = find_baudrate(odriveCAN.odrive_config_file)
-            odriveCAN.baud_rate = str(baud_rate)
-        else:
-            odriveCAN.baud_rate = "250000"
-        
-        LOGGER.info("Remember to run 'sudo ip link set can0 up type can bitrate <baud_rate>' "+
-                    "in your terminal. See the README Troubleshooting section for more details.")
-
-        def periodically_surface_errors(odriveCAN):
-            while True:
-                asyncio.run(odriveCAN.surface_errors())
-                time.sleep(1)
-
-        error_thread = Thread(target = periodically_surface_errors, args=[odriveCAN])
-        error_thread.setDaemon(True) 
-        error_thread.start()
-
-        def periodically_check_goal(odriveCAN):
-            while True:
-                asyncio.run(odriveCAN.check_goal())
-                time.sleep(0.5)
-
-        goal_thread = Thread(target = periodically_check_goal, args=[odriveCAN])
-        goal_thread.setDaemon(True) 
-        goal_thread.start()
+        odriveCAN.connection = None
+        odriveCAN.goal = None
+        odriveCAN.stream = None
+        odriveCAN.recorder = None
+        odriveCAN.scheduler = PeriodicScheduler()
+        odriveCAN.telemetry = AxisTelemetry()
+        odriveCAN.faults = FaultMonitor(odriveCAN.telemetry, odriveCAN.send_can_frame, odriveCAN.on_fault)
+        channel = config.attributes.fields["canbus_channel"].string_value or DEFAULT_CHANNEL
+        interface = config.attributes.fields["canbus_interface"].string_value or DEFAULT_INTERFACE
+        odriveCAN.dispatcher = get_dispatcher(channel, interface)
+        try:
+            odriveCAN.codec = odriveCAN.dispatcher.codec
+            odriveCAN.odrive_config_file = config.attributes.fields["odrive_config_file"].string_value
+            odriveCAN.arbitration_ids = odriveCAN.codec.arbitration_ids(odriveCAN.nodeID)
+            odriveCAN.serial_number = config.attributes.fields["serial_number"].string_value
+            odriveCAN.torque_constant = 1
+            odriveCAN.current_limit = 10
+            odriveCAN.offset = 0.0
+            odriveCAN.metrics = Metrics()
+            odriveCAN.telemetry.attach(odriveCAN.dispatcher, odriveCAN.nodeID)
+            odriveCAN.dispatcher.clear_shadow(odriveCAN.nodeID)
+            odriveCAN.faults.attach()
+            odriveCAN.heartbeat_lost = False
+            odriveCAN.attached_at = time.time()
+
+            if odriveCAN.odrive_config_file != "":
+                if odriveCAN.serial_number == "":
+                    LOGGER.info("If you are using multiple Odrive controllers, make sure to add their respective serial_number to each component attributes")
+                odriveCAN.read_motor_limits()
+                odriveCAN.connect_timeout = config.attributes.fields["connect_timeout"].number_value or DEFAULT_CONNECT_TIMEOUT
+                # the config file is applied over serial in the background so that components do not wait on each other
+                odriveCAN.connection = asyncio.get_running_loop().create_task(odriveCAN.apply_odrive_config(odriveCAN.connect_timeout))
+
+            odriveCAN.baud_rate = odriveCAN.read_baud_rate(config, DEFAULT_BAUD_RATE)
+            LOGGER.info("Remember to run 'sudo ip link set " + odriveCAN.dispatcher.channel + " up type can bitrate <baud_rate>' "+
+                        "in your terminal. See the README Troubleshooting section for more details.")
+            odriveCAN.register_bus_load()
+            odriveCAN.check_bus_load()
+
+            odriveCAN.set_telemetry_max_age(config)
+            odriveCAN.set_fault_policy(config)
+            odriveCAN.schedule_periodic_jobs(config)
+        except Exception:
+            # nothing owns the subscriptions or the reference to the CAN interface until new() returns
+            odriveCAN.release()
+            raise
 
         return odriveCAN
     
@@ -110,158 +133,597 @@ class OdriveCAN(Motor, Reconfigurable):
     def validate(cls, config: ComponentConfig):
         return
 
+    # Every change is applied synchronously, between two steps of the event loop, so no command or telemetry read
+    # sees a node id, interface or baud rate half way through being changed. The CAN interface stays open unless
+    # the component moves to another one.
     def reconfigure(self, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]):
-        if config.attributes.fields["canbus_baud_rate"].string_value != "":
-            baud_rate = config.attributes.fields["canbus_baud_rate"].string_value
-            baud_rate = baud_rate.replace("k", "000")
-            baud_rate = baud_rate.replace("K", "000")
-        elif self.odrive_config_file != "":
-            baud_rate = find_baudrate(self.odrive_config_file)
-            baud_rate = str(baud_rate)
-        else:
-            baud_rate = self.baud_rate
+        channel = config.attributes.fields["canbus_channel"].string_value or DEFAULT_CHANNEL
+        interface = config.attributes.fields["canbus_interface"].string_value or DEFAULT_INTERFACE
+        if (channel, interface) != (self.dispatcher.channel, self.dispatcher.interface):
+            self.set_dispatcher(get_dispatcher(channel, interface))
 
+        baud_rate = self.read_baud_rate(config, self.baud_rate)
         if baud_rate != self.baud_rate:
             self.baud_rate = baud_rate
-            LOGGER.info("Since you changed the baud rate, you must run 'sudo ip link set can0 up type can bitrate <baud_rate>' "+
+            LOGGER.info("Since you changed the baud rate, you must run 'sudo ip link set " + self.dispatcher.channel + " up type can bitrate <baud_rate>' "+
                          "in your terminal. See the README Troubleshooting section for more details.")
+            self.check_bus_load()
         
-        new_nodeID = config.attributes.fields["canbus_node_id"].number_value
+        new_nodeID = int(config.attributes.fields["canbus_node_id"].number_value)
         if new_nodeID != self.nodeID:
             self.set_node_id(new_nodeID)
 
+        self.set_telemetry_max_age(config)
+        self.set_fault_policy(config)
+        self.schedule_periodic_jobs(config)
+
+    # The canbus_baud_rate attribute, else the config file's baud rate, else default. An attribute that is not a bit
+    # rate is logged and default used, as for the other attributes.
+    def read_baud_rate(self, config: ComponentConfig, default: int) -> int:
+        baud_rate = config.attributes.fields["canbus_baud_rate"].string_value
+        if baud_rate != "":
+            try:
+                return parse_baud_rate(baud_rate)
+            except ValueError:
+                LOGGER.error(f"'canbus_baud_rate' must be a bit rate such as 250000, 250k or 1M, got '{baud_rate}', using {default}")
+                return default
+        if self.odrive_config_file != "":
+            return int(find_baudrate(self.odrive_config_file))
+        return default
+
+    # A config file without the motor's torque constant or lock-in current leaves the defaults in place, as before
+    # the file is applied.
+    def read_motor_limits(self):
+        try:
+            self.torque_constant = find_axis_configs(self.odrive_config_file, ["motor", "torque_constant"])
+            self.current_limit = find_axis_configs(self.odrive_config_file, ["general_lockin", "current"])
+        except (OSError, ValueError, KeyError) as e:
+            LOGGER.error(f"Could not read the torque constant and lock-in current from {self.odrive_config_file}: {e}")
+
+    def set_telemetry_max_age(self, config: ComponentConfig):
+        self.telemetry_max_age = None
+        if "telemetry_max_age" in config.attributes.fields:
+            self.telemetry_max_age = config.attributes.fields["telemetry_max_age"].number_value
+
+    def set_fault_policy(self, config: ComponentConfig):
+        policy = config.attributes.fields["fault_policy"].string_value or DEFAULT_FAULT_POLICY
+        if policy not in FAULT_POLICIES:
+            LOGGER.error(f"'fault_policy' must be one of {', '.join(FAULT_POLICIES)}, got '{policy}', using '{DEFAULT_FAULT_POLICY}'")
+            policy = DEFAULT_FAULT_POLICY
+        self.faults.policy = policy
+        self.faults.resize(int(config.attributes.fields["fault_history_size"].number_value) or DEFAULT_FAULT_HISTORY)
+
+    def schedule_periodic_jobs(self, config: ComponentConfig):
+        self.error_check_period = DEFAULT_ERROR_CHECK_PERIOD
+        if config.attributes.fields["error_check_period"].number_value > 0:
+            self.error_check_period = config.attributes.fields["error_check_period"].number_value
+
+        self.scheduler.schedule("watch_heartbeat", self.watch_heartbeat, self.error_check_period)
+
+        if "metrics" in config.attributes.fields:
+            self.enable_metrics(config.attributes.fields["metrics"].bool_value)
+        if config.attributes.fields["metrics_dump_period"].number_value > 0:
+            self.scheduler.schedule("dump_metrics", self.dump_metrics, config.attributes.fields["metrics_dump_period"].number_value)
+        else:
+            self.scheduler.cancel("dump_metrics")
+
+    # Only motors with an odrive_config_file connect over USB, so only they load odrive's discovery.
+    async def apply_odrive_config(self, timeout):
+        from ..discovery import connect_odrive
+
+        def configure(odrv):
+            odrv.clear_errors()
+            set_configs(odrv, self.odrive_config_file)
+            rsetattr(odrv, "axis0.config.can.node_id", self.nodeID)
+
+        try:
+            self.odrv, _ = await connect_odrive(self.serial_number, configure, timeout)
+        except Exception as e:
+            LOGGER.error(f"Could not set odrive configurations because no serial odrive connection was found: {e}")
+
+    async def close(self):
+        self.release()
+
+    # Stops everything the component runs and drops its reference to the CAN interface, which is closed in the
+    # background once no other component uses it.
+    def release(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.connection is not None:
+            self.connection.cancel()
+        self.scheduler.cancel_all()
+        self.cancel_goal()
+        self.stop_stream()
+        self.stop_recording()
+        self.faults.detach()
+        self.telemetry.detach()
+        bandwidth.unregister_node(self.dispatcher.channel, self.nodeID)
+        release_dispatcher(self.dispatcher)
+
+    @timed
     async def set_power(self, power: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         if abs(power) < 0.001:
             LOGGER.error("Cannot move motor at a power percent that is nearly 0")
         torque = power*self.current_limit*self.torque_constant
-        await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x08})
-        await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
-        await self.send_can_message('Set_Controller_Mode', {'Control_Mode': 0x01, 'Input_Mode': 0x01})
+        self.cancel_goal()
+        self.stop_stream()
+        await self.send_can_message_if_changed('Set_Controller_Mode', {'Control_Mode': 0x01, 'Input_Mode': 0x01})
+        await self.enter_closed_loop_control()
         await self.send_can_message('Set_Input_Torque', {'Input_Torque': torque})
 
+    @timed
     async def go_for(self, rpm: float, revolutions: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         if abs(rpm) < 0.001:
             LOGGER.error("Cannot move motor at an RPM that is nearly 0")
         rps = rpm / MINUTE_TO_SECOND
-        await self.send_can_message('Set_Controller_Mode', {'Control_Mode': 0x03, 'Input_Mode': 0x05})
-        await self.send_can_message('Set_Traj_Vel_Limit', {'Traj_Vel_Limit': abs(rps)})
-        await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x08})
-        await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
+        self.cancel_goal()
+        self.stop_stream()
+        await self.send_can_message_if_changed('Set_Controller_Mode', {'Control_Mode': 0x03, 'Input_Mode': 0x05})
+        await self.send_can_message_if_changed('Set_Traj_Vel_Limit', {'Traj_Vel_Limit': abs(rps)})
+        await self.enter_closed_loop_control()
 
         current_position = await self.get_position()
         goal_position = current_position + math.copysign(revolutions, rpm) + self.offset
+        goal = self.start_goal(goal_position)
         await self.send_can_message('Set_Input_Pos', {'Input_Pos': (goal_position), 'Vel_FF': 0, 'Torque_FF': 0})
 
-        self.goal["position"] = goal_position
-        self.goal["active"] = True
+        if extra is not None and extra.get("wait", False):
+            if not await goal.wait(abs(revolutions / rps) * 2 + MESSAGE_TIMEOUT):
+                LOGGER.warning("Motor did not reach its goal position in the expected time")
     
+    @timed
     async def go_to(self, rpm: float, revolutions: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         current_position = await self.get_position()
         revolutions = revolutions - current_position
         if abs(revolutions) > 0.01:
-            await self.go_for(rpm, revolutions)
+            await self.go_for(rpm, revolutions, extra)
         else:
             LOGGER.info("Already at requested position")
     
+    @timed
     async def set_rpm(self, rpm: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         if abs(rpm) < 0.001:
             LOGGER.error("Cannot move motor at an RPM that is nearly 0")
         rps = rpm / MINUTE_TO_SECOND
-        await self.send_can_message('Set_Controller_Mode', {'Control_Mode': 0x02, 'Input_Mode': 0x01})
-        await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x08})
-        await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
+        self.cancel_goal()
+        self.stop_stream()
+        await self.send_can_message_if_changed('Set_Controller_Mode', {'Control_Mode': 0x02, 'Input_Mode': 0x01})
+        await self.enter_closed_loop_control()
         await self.send_can_message('Set_Input_Vel', {'Input_Vel': rps, 'Input_Torque_FF': 0})
 
+    @timed
     async def reset_zero_position(self, offset: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         position = await self.get_position()
         self.offset += position
 
+    @timed
     async def get_position(self, extra: Optional[Dict[str, Any]] = None, **kwargs) -> float:
-        for msg in self.bus:
-            if msg.arbitration_id == ((self.nodeID << 5) | self.db.get_message_by_name('Get_Encoder_Estimates').frame_id):
-                encoderCount = self.db.decode_message('Get_Encoder_Estimates', msg.data)
-                return encoderCount['Pos_Estimate'] - self.offset
+        await self.wait_for_fresh_telemetry(ENCODER_ESTIMATES, extra)
+        if self.telemetry.position is not None:
+            return self.telemetry.position - self.offset
 
-        LOGGER.error("Position estimates not received, check that can0 is configured correctly")
+        LOGGER.error("Position estimates not received, check that " + self.dispatcher.channel + " is configured correctly")
         return 0.0
     
     async def get_properties(self, extra: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, **kwargs) -> Motor.Properties:
         return Motor.Properties(position_reporting=True)
     
+    @timed
     async def stop(self, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        self.cancel_goal()
+        self.stop_stream()
+        self.dispatcher.clear_shadow(self.nodeID)
         await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x01})
 
+    @timed
     async def is_powered(self, extra: Optional[Dict[str, Any]] = None, **kwargs) -> Tuple[bool, float]:
-        current_power = 0
-        for msg in self.bus:
-            if msg.arbitration_id == ((self.nodeID << 5) | self.db.get_message_by_name('Heartbeat').frame_id):
-                current_state = self.db.decode_message('Heartbeat', msg.data)['Axis_State']
-                if (current_state != 0x0) & (current_state != 0x1):
-                    for msg1 in self.bus:
-                        if msg1.arbitration_id == ((self.nodeID << 5) | self.db.get_message_by_name('Get_Iq').frame_id):
-                            current = self.db.decode_message('Get_Iq', msg1.data)['Iq_Setpoint']
-                            current_power = current/self.current_limit
-                            return [True, current_power]
-                else:
-                    return [False, 0]
+        await self.wait_for_fresh_telemetry(HEARTBEAT, extra)
+        current_state = self.telemetry.axis_state
+        if current_state is None:
+            return [False, 0]
+        if (current_state != 0x0) & (current_state != 0x1):
+            await self.wait_for_fresh_telemetry(IQ, extra)
+            if self.telemetry.iq_setpoint is None:
+                LOGGER.error("Iq messages not received, check that iq_msg_rate_ms is set on the odrive")
+                return [True, 0]
+            current_power = self.telemetry.iq_setpoint/self.current_limit
+            return [True, current_power]
+        else:
+            return [False, 0]
 
+    @timed
     async def is_moving(self) -> bool:
-        for msg in self.bus:
-            if msg.arbitration_id == ((self.nodeID << 5) | self.db.get_message_by_name('Get_Encoder_Estimates').frame_id):
-                estimates = self.db.decode_message('Get_Encoder_Estimates', msg.data)
-                if abs(estimates['Vel_Estimate']) > 0.0:
-                    return True
-                else:
-                    return False
+        velocity = self.telemetry.velocity
+        if velocity is not None and abs(velocity) > 0.0:
+            return True
+        else:
+            return False
     
     async def get_geometries(self) -> List[Geometry] :
         pass
                 
-    async def do_command(self) -> Dict[str, Any]:
-        pass
+    async def do_command(self, command: Mapping[str, Any], *, timeout: Optional[float] = None, **kwargs) -> Mapping[str, Any]:
+        result = {}
+        if "telemetry" in command:
+            result["telemetry"] = self.telemetry.snapshot()
+        if "stream" in command:
+            await self.start_stream(command["stream"].get("mode", "velocity"), command["stream"].get("rate_hz", DEFAULT_STREAM_RATE),
+                                    command["stream"].get("timeout_s"))
+            result["stream"] = True
+        if "setpoint" in command:
+            self.update_stream(command["setpoint"])
+            result["setpoint"] = True
+        if "trajectory" in command:
+            result["trajectory"] = await self.start_trajectory(command["trajectory"])
+        if "stream_stop" in command:
+            self.stop_stream()
+            result["stream_stop"] = True
+        if "record" in command:
+            self.start_recording(command["record"].get("capacity", DEFAULT_RECORD_CAPACITY))
+            result["record"] = True
+        if "record_stop" in command:
+            self.stop_recording()
+            result["record_stop"] = True
+        if "record_snapshot" in command:
+            result["record_snapshot"] = self.check_recorder().snapshot(int(command["record_snapshot"].get("samples", DEFAULT_SNAPSHOT_SAMPLES)))
+        if "record_export" in command:
+            result["record_export"] = await run_blocking(self.check_recorder().export, command["record_export"].get("path", self.default_export_path()))
+        if "metrics" in command:
+            options = command["metrics"] if isinstance(command["metrics"], Mapping) else {}
+            if options.get("reset", False):
+                self.metrics.reset()
+                self.dispatcher.metrics.reset()
+            if "enable" in options:
+                self.enable_metrics(options["enable"])
+            result["metrics"] = self.metrics_snapshot()
+        if "request" in command:
+            names = [command["request"]] if isinstance(command["request"], str) else command["request"]
+            for name in names:
+                if name not in REQUESTABLE:
+                    raise ValueError(f"{name} cannot be requested, expected one of {', '.join(REQUESTABLE)}")
+            replies = await asyncio.gather(*[self.request_can_message(name) for name in names])
+            result["request"] = dict(zip(names, replies))
+        if "errors" in command:
+            result["errors"] = await self.request_errors()
+        if "faults" in command:
+            options = command["faults"] if isinstance(command["faults"], Mapping) else {}
+            result["faults"] = {"policy": self.faults.policy, "faulted": self.faults.faulted,
+                                "history": self.faults.snapshot(int(options.get("limit", 0)))}
+        if "clear_faults" in command:
+            await self.clear_errors()
+            result["clear_faults"] = True
+        if "bus_plan" in command:
+            options = command["bus_plan"] if isinstance(command["bus_plan"], Mapping) else {}
+            result["bus_plan"] = await self.plan_bus_load(options.get("target", bandwidth.DEFAULT_TARGET_UTILIZATION), options.get("apply", False))
+        return result
 
     async def wait_until_correct_state(self, state):
-        timeout = time.time() + 60
-        for msg in self.bus:
-            if time.time() > timeout:
-                LOGGER.error("Unable to set to requested state, setting to idle")
-                await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x01})
-                return
-            if msg.arbitration_id == ((self.nodeID << 5) | self.db.get_message_by_name('Heartbeat').frame_id):
-                current_state = self.db.decode_message('Heartbeat', msg.data)['Axis_State']
-                if current_state == state:
-                    return
-
-    async def surface_errors(self):
-        for msg in self.bus:
-            if msg.arbitration_id == ((self.nodeID << 5) | self.db.get_message_by_name('Heartbeat').frame_id):
-                errors = self.db.decode_message('Heartbeat', msg.data)['Axis_Error']
-                if errors != 0x0:
-                    await self.stop()
-                    LOGGER.error("axis:", ODriveError(errors))
-                    await self.clear_errors()
-
-    async def check_goal(self):
-        if self.goal["active"]:
-            position = await self.get_position()
-            if abs(position - self.goal["position"]) < 0.01:
-                await self.stop()
-                self.goal["active"] = False
+        started = time.time()
+        timeout = started + 60
+        while time.time() < timeout:
+            heartbeat = await self.wait_for_can_message('Heartbeat', timeout - time.time())
+            if heartbeat is not None and heartbeat['Axis_State'] == state:
+                self.metrics.observe("state_wait", time.time() - started)
+                return True
+        self.metrics.increment("state_wait_timeouts")
+        LOGGER.error("Unable to set to requested state, setting to idle")
+        await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x01})
+        return False
+
+    # The fault monitor has already sent the policy's reaction from the CAN reader thread. Here anything that would
+    # keep commanding the axis is stopped, and the detailed error registers are fetched for the fault history. Only
+    # the idle policy clears the error afterwards; an estop or held axis stays faulted until clear_faults.
+    def on_fault(self, fault):
+        errors = fault["axis_error"]
+        fault["name"] = error_name(errors)
+        self.metrics.increment("axis_errors")
+        self.metrics.observe("fault_reaction", fault["reaction_latency"])
+        self.cancel_goal()
+        self.stop_stream()
+        self.dispatcher.clear_shadow(self.nodeID)
+        LOGGER.error(f"axis error: {fault['name']} ({errors:#x}), reacted with {fault['policy']}")
+        asyncio.create_task(self.fetch_fault_details(fault))
+
+    async def fetch_fault_details(self, fault):
+        details = await self.request_errors()
+        del details["axis_error"]
+        fault.update(details)
+        if fault["policy"] == "idle":
+            await self.clear_errors()
+        fault["cleared"] = fault["policy"] == "idle"
+
+    # Faults are only detected from heartbeats, so their absence is reported once each time they stop arriving.
+    async def watch_heartbeat(self):
+        # the first heartbeat after attaching to a node may take up to a period to arrive, so none yet is not a loss
+        if self.telemetry.timestamps[HEARTBEAT] is None and time.time() - self.attached_at < self.error_check_period:
+            return
+        lost = self.telemetry.is_stale(HEARTBEAT, self.error_check_period)
+        if lost and not self.heartbeat_lost:
+            self.metrics.increment("heartbeat_lost")
+            LOGGER.warning(f"No heartbeat from node {self.nodeID} in {self.error_check_period}s, check that " + self.dispatcher.channel +
+                           " is configured correctly and heartbeat_msg_rate_ms is set on the odrive")
+        self.heartbeat_lost = lost
+
+    # Bus metrics are kept by the dispatcher and shared by every component on the CAN interface, so enabling or
+    # disabling them here applies to all of them.
+    def enable_metrics(self, enabled):
+        self.metrics.enabled = enabled
+        self.dispatcher.metrics.enabled = enabled
+
+    def metrics_snapshot(self):
+        snapshot = self.metrics.snapshot()
+        snapshot["bus"] = self.dispatcher.metrics.snapshot()
+        return snapshot
+
+    async def dump_metrics(self):
+        LOGGER.info(f"metrics for node {self.nodeID}: {json.dumps(self.metrics_snapshot())}")
+
+    # Nodes are registered with the cyclic message rates of their config file, so the bus load of every node on the
+    # interface can be checked against its baud rate. Nodes without a config file broadcast at rates this module
+    # cannot know, and are left out.
+    def register_bus_load(self):
+        if self.odrive_config_file == "":
+            return
+        try:
+            periods = bandwidth.read_periods(load_config(self.odrive_config_file)["flat"])
+        except (OSError, ValueError) as e:
+            LOGGER.error(f"Could not read message rates from {self.odrive_config_file}: {e}")
+            return
+        bandwidth.register_node(self.dispatcher.channel, self.nodeID, periods, self.odrive_config_file)
+
+    def check_bus_load(self):
+        plan = bandwidth.plan(self.dispatcher.channel, self.baud_rate)
+        if plan["oversubscribed"]:
+            LOGGER.warning(f"Cyclic messages of the nodes on {self.dispatcher.channel} use {plan['utilization']:.0%} of its "
+                           f"{self.baud_rate} bit/s, above the {plan['target_utilization']:.0%} target. Run the bus_plan "
+                           "command to see rates that fit.")
+
+    # Applying a plan rewrites the *_msg_rate_ms values in the config files of the nodes it changes. This motor's
+    # ODrive is reconfigured right away; the others pick up their new rates the next time they are configured.
+    async def plan_bus_load(self, target, apply):
+        plan = bandwidth.plan(self.dispatcher.channel, self.baud_rate, target)
+        if apply and plan["proposed"]:
+            plan["rewritten"] = await run_blocking(bandwidth.apply_plan, self.dispatcher.channel, plan["proposed"])
+            if self.odrive_config_file in plan["rewritten"] and (self.connection is None or self.connection.done()):
+                self.connection = asyncio.create_task(self.apply_odrive_config(self.connect_timeout))
+        return plan
+
+    # The goal is checked against every encoder estimate and heartbeat as it arrives, and the motor is
+    # stopped as soon as it is reached.
+    def start_goal(self, position):
+        self.goal = MoveGoal(self.telemetry, position)
+        self.telemetry.add_listener(self.goal.check)
+        asyncio.create_task(self.stop_at_goal(self.goal))
+        return self.goal
+
+    def cancel_goal(self):
+        if self.goal is not None:
+            self.telemetry.remove_listener(self.goal.check)
+            self.goal.cancel()
+            self.goal = None
+
+    async def stop_at_goal(self, goal: MoveGoal):
+        if await goal.wait() and goal is self.goal:
+            await self.stop()
     
+    # Configures the controller for the stream's mode once, then starts transmitting a setpoint that holds the
+    # motor where it is: zero velocity or torque, or the current position. With a timeout, the stream is checked
+    # a few times per timeout and falls back to that holding setpoint whenever no setpoint arrived within it.
+    async def start_stream(self, mode, rate, timeout=None):
+        if mode not in STREAM_MODES:
+            raise ValueError(f"stream mode must be one of {list(STREAM_MODES)}, got {mode}")
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not math.isfinite(rate) or rate <= 0:
+            raise ValueError(f"stream rate_hz must be a positive number, got {rate}")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout < 0):
+            raise ValueError(f"stream timeout_s must be a non-negative number of seconds, got {timeout}")
+        self.cancel_goal()
+        self.stop_stream()
+        controller_mode, name = STREAM_MODES[mode]
+        await self.send_can_message_if_changed('Set_Controller_Mode', controller_mode)
+        await self.enter_closed_loop_control()
+
+        # an omitted timeout_s arrives as 0, which turns the dead-man check off
+        timeout = timeout or None
+        self.stream = SetpointStream(self.dispatcher, mode, self.arbitration_ids[name], self.codec[name], rate, timeout)
+        self.stream.start(self.stream_payload(mode, await self.get_position() if mode == "position" else 0.0))
+        if timeout is not None:
+            self.scheduler.schedule("stream_timeout", self.check_stream_timeout, timeout / STREAM_TIMEOUT_CHECKS)
+
+    async def check_stream_timeout(self):
+        stream = self.stream
+        if not isinstance(stream, SetpointStream) or not stream.expired():
+            return
+        self.metrics.increment("stream_timeouts")
+        if stream.mode == "position":
+            position = self.telemetry.position
+            if position is None:
+                return
+            stream.hold(self.stream_payload(stream.mode, position - self.offset))
+        else:
+            stream.hold(self.stream_payload(stream.mode, 0.0))
+        LOGGER.warning(f"no {stream.mode} setpoint received in {stream.timeout}s, holding the motor until the next one")
+
+    # Plans a profile from the current position through the waypoints, in revolutions like GoTo, and streams it as
+    # position setpoints with velocity and torque feed forward. The ODrive holds the last waypoint afterwards.
+    async def start_trajectory(self, options):
+        waypoints = parse_waypoints(options.get("waypoints", []), options.get("rpm"), options.get("rpm_per_sec"))
+        # checked before anything is sent, so that a bad command leaves the axis as it was
+        rate = parse_rate(options.get("rate_hz", DEFAULT_STREAM_RATE))
+        self.cancel_goal()
+        self.stop_stream()
+        controller_mode, name = STREAM_MODES["position"]
+        await self.send_can_message_if_changed('Set_Controller_Mode', controller_mode)
+        await self.enter_closed_loop_control()
+
+        start = await self.get_position() + self.offset
+        profile = plan_profile(start, [(position + self.offset, vel_limit, accel_limit) for position, vel_limit, accel_limit in waypoints], rate)
+        trajectory = TrajectoryStream(self.dispatcher, self.arbitration_ids[name], self.codec[name], profile, rate,
+                                      options.get("inertia", 0.0))
+        self.stream = trajectory
+        trajectory.start()
+        result = {"duration": profile.duration, "samples": len(profile.time)}
+        if options.get("wait", False):
+            result["completed"] = await trajectory.wait(profile.duration + MESSAGE_TIMEOUT)
+            result["skipped"] = trajectory.skipped
+        return result
+
+    # value is in RPM for velocity streams, Nm for torque streams and revolutions for position streams
+    def update_stream(self, value):
+        if self.stream is None or self.stream.mode not in STREAM_MODES:
+            raise ValueError("no stream is running, start one with {\"stream\": {\"mode\": ...}}")
+        self.stream.update(self.stream_payload(self.stream.mode, value))
+
+    def stop_stream(self):
+        self.scheduler.cancel("stream_timeout")
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+
+    def stream_payload(self, mode, value):
+        if mode == "velocity":
+            return {'Input_Vel': value / MINUTE_TO_SECOND, 'Input_Torque_FF': 0}
+        if mode == "torque":
+            return {'Input_Torque': value}
+        return {'Input_Pos': value + self.offset, 'Vel_FF': 0, 'Torque_FF': 0}
+
+    # Starting a recording discards the previous one. A stopped recording can still be read and exported until the
+    # next one starts.
+    def start_recording(self, capacity):
+        # struct numbers arrive as floats, so 1000.0 is accepted but 0, -5 and 2.5 are not
+        if isinstance(capacity, bool) or not isinstance(capacity, (int, float)) or not float(capacity).is_integer() or capacity < 1:
+            raise ValueError(f"record capacity must be a positive whole number of samples, got {capacity}")
+        self.stop_recording()
+        self.recorder = AxisRecorder(int(capacity))
+        self.recorder.attach(self.dispatcher, self.nodeID)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.detach()
+
+    def check_recorder(self) -> AxisRecorder:
+        if self.recorder is None:
+            raise ValueError("nothing has been recorded, start a recording with {\"record\": {}}")
+        return self.recorder
+
+    def default_export_path(self):
+        return os.path.join(os.environ.get("VIAM_MODULE_DATA", tempfile.gettempdir()),
+                            f"odrive-node{self.nodeID}-{time.strftime('%Y%m%d-%H%M%S')}.npz")
+
     async def clear_errors(self):
         await self.send_can_message('Clear_Errors', {})
 
-    async def set_node_id(self, new_nodeID):
-        await self.send_can_message('Set_Axis_Node_ID', {'Axis_Node_ID': new_nodeID})
+    # The ODrive is renumbered with a frame sent to its old id, and every subscription moves to the new id in the
+    # same step. A running stream addresses the old id, so it is stopped.
+    def set_node_id(self, new_nodeID):
+        self.stop_stream()
+        self.send_can_frame('Set_Axis_Node_ID', {'Axis_Node_ID': new_nodeID})
+        bandwidth.unregister_node(self.dispatcher.channel, self.nodeID)
+        self.dispatcher.clear_shadow(self.nodeID)
         self.nodeID = new_nodeID
+        self.dispatcher.clear_shadow(self.nodeID)
+        self.arbitration_ids = self.codec.arbitration_ids(self.nodeID)
+        self.attach_to_bus()
+
+    # Moves the component to another CAN interface, and releases the one it used.
+    def set_dispatcher(self, dispatcher: CANDispatcher):
+        self.stop_stream()
+        bandwidth.unregister_node(self.dispatcher.channel, self.nodeID)
+        previous = self.dispatcher
+        previous.clear_shadow(self.nodeID)
+        self.dispatcher = dispatcher
+        self.codec = dispatcher.codec
+        self.dispatcher.clear_shadow(self.nodeID)
+        self.attach_to_bus()
+        release_dispatcher(previous)
+
+    def attach_to_bus(self):
+        self.telemetry.attach(self.dispatcher, self.nodeID)
+        self.attached_at = time.time()
+        if self.recorder is not None and self.recorder.recording:
+            self.recorder.attach(self.dispatcher, self.nodeID)
+        self.register_bus_load()
+
+    # Telemetry is served from the latest received frames. Callers that need a bound on its age can pass
+    # {"max_age": seconds} in extra, or set telemetry_max_age for every call, in which case a stale value is
+    # refreshed by requesting it from the ODrive, or by waiting for the next heartbeat, which cannot be requested.
+    async def wait_for_fresh_telemetry(self, name, extra: Optional[Dict[str, Any]] = None):
+        max_age = extra["max_age"] if extra is not None and "max_age" in extra else self.telemetry_max_age
+        fetch = self.request_can_message if name in REQUESTABLE else self.wait_for_can_message
+        if self.telemetry.timestamps[name] is None:
+            self.metrics.increment(f"telemetry_missing.{name}")
+            await fetch(name)
+        elif max_age is not None and self.telemetry.is_stale(name, max_age):
+            self.metrics.increment(f"telemetry_stale.{name}")
+            await fetch(name)
+        elif self.metrics.enabled:
+            self.metrics.observe(f"telemetry_age.{name}", self.telemetry.age(name))
+
+    # The shadow holds the controller mode and trajectory limits last sent to the axis, by this or any other component
+    # on the interface, such as a canbus_group, which clears it when it commands the node. It is only trusted while
+    # the latest heartbeat confirms closed loop control, so anything that drops the axis out of it, such as an
+    # error, a stop or a reboot, makes the next command resend the full configuration.
+    @property
+    def shadow(self) -> Dict[str, Any]:
+        return self.dispatcher.shadow(self.nodeID)
+
+    def in_closed_loop_control(self):
+        return (self.shadow.get('closed_loop', False)
+                and self.telemetry.axis_state == CLOSED_LOOP_CONTROL
+                and not self.telemetry.is_stale(HEARTBEAT, MESSAGE_TIMEOUT))
+
+    async def send_can_message_if_changed(self, name, data):
+        if self.in_closed_loop_control() and self.shadow.get(name) == data:
+            self.metrics.increment("shadow_skipped")
+            return
+        await self.send_can_message(name, data)
+        self.shadow[name] = data
+
+    async def enter_closed_loop_control(self):
+        if self.in_closed_loop_control():
+            return
+        # the axis is not enabled before its config file has been applied, or has failed to
+        if self.connection is not None and not self.connection.done():
+            await asyncio.shield(self.connection)
+        await self.send_can_message('Set_Axis_State', {'Axis_Requested_State': 0x08})
+        self.shadow['closed_loop'] = await self.wait_until_correct_state(CLOSED_LOOP_CONTROL)
+
+    async def wait_for_can_message(self, name, timeout=MESSAGE_TIMEOUT):
+        decoded = await self.dispatcher.wait_for(self.nodeID, self.codec[name].cmd_id, timeout)
+        if decoded is None:
+            self.metrics.increment(f"message_timeouts.{name}")
+        return decoded
+
+    # Sends a remote request for the message, so that it can be read even when the ODrive does not broadcast it.
+    async def request_can_message(self, name, timeout=MESSAGE_TIMEOUT):
+        self.metrics.increment(f"requests.{name}")
+        try:
+            decoded = await self.dispatcher.request(self.nodeID, self.codec[name].cmd_id, timeout)
+        except can.CanError:
+            LOGGER.error("Request (" + name + ") NOT sent! Please verify " + self.dispatcher.channel + " is working first")
+            return None
+        if decoded is None:
+            self.metrics.increment(f"message_timeouts.{name}")
+        return decoded
+
+    async def request_errors(self):
+        motor, encoder, sensorless = await asyncio.gather(self.request_can_message(MOTOR_ERROR), self.request_can_message(ENCODER_ERROR),
+                                                          self.request_can_message(SENSORLESS_ERROR))
+        return {
+            "axis_error": self.telemetry.axis_error,
+            "motor_error": None if motor is None else motor['Motor_Error'],
+            "encoder_error": None if encoder is None else encoder['Encoder_Error'],
+            "sensorless_error": None if sensorless is None else sensorless['Sensorless_Error'],
+        }
 
     async def send_can_message(self, name, data):
-        msg = self.db.get_message_by_name(name)
-        data = msg.encode(data)
-        msg = can.Message(arbitration_id=msg.frame_id | self.nodeID << 5, is_extended_id=False, data=data)
+        self.send_can_frame(name, data)
+
+    def send_can_frame(self, name, data):
+        msg = can.Message(arbitration_id=self.arbitration_ids[name], is_extended_id=False, data=self.codec[name].encode(data))
         try:
-            self.bus.send(msg)
+            self.dispatcher.send(msg)
         except can.CanError:
-            LOGGER.error("Message (" + name + ") NOT sent! Please verify can0 is working first")
-            LOGGER.info("You may need to run 'sudo ip link set can0 up type can bitrate <baud_rate>' in your terminal. " +
+            LOGGER.error("Message (" + name + ") NOT sent! Please verify " + self.dispatcher.channel + " is working first")
+            LOGGER.info("You may need to run 'sudo ip link set " + self.dispatcher.channel + " up type can bitrate <baud_rate>' in your terminal. " +
                          "See the README Troubleshooting section for more details.")
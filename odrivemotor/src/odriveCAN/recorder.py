@@ -0,0 +1,110 @@
+"""
+Opt-in high rate recorder for the telemetry a single axis's CAN frames carry. Every recorded message has its own
+ring buffer of preallocated NumPy columns, so recording at full bus rate allocates nothing per frame and its memory
+is fixed when recording starts.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .dispatcher import CANDispatcher
+from .telemetry import HEARTBEAT, ENCODER_ESTIMATES, IQ, VBUS_VOLTAGE
+
+DEFAULT_RECORD_CAPACITY = 65536
+
+# message -> (signal, column dtype). Floats are stored at the 32 bit precision they have on the wire.
+RECORDED_SIGNALS: Dict[str, List[Tuple[str, str]]] = {
+    HEARTBEAT: [('Axis_Error', 'u4'), ('Axis_State', 'u1'), ('Motor_Flags', 'u1'), ('Encoder_Flags', 'u1'),
+                ('Controller_Flags', 'u1')],
+    ENCODER_ESTIMATES: [('Pos_Estimate', 'f4'), ('Vel_Estimate', 'f4')],
+    IQ: [('Iq_Setpoint', 'f4'), ('Iq_Measured', 'f4')],
+    VBUS_VOLTAGE: [('Vbus_Voltage', 'f4')],
+}
+
+
+class MessageRing:
+    capacity: int
+    count: int
+    columns: Dict[str, np.ndarray]
+
+    def __init__(self, signals: List[Tuple[str, str]], capacity: int):
+        self.capacity = capacity
+        # total samples ever appended; the newest one is at (count - 1) % capacity
+        self.count = 0
+        self.columns = {'timestamp': np.zeros(capacity, 'f8')}
+        self.columns.update({name: np.zeros(capacity, dtype) for name, dtype in signals})
+        self._signals = [(name, self.columns[name]) for name, _ in signals]
+        self._timestamps = self.columns['timestamp']
+
+    def append(self, decoded: Dict[str, Any], timestamp: float):
+        i = self.count % self.capacity
+        self._timestamps[i] = timestamp
+        for name, column in self._signals:
+            column[i] = decoded[name]
+        self.count += 1
+
+    def window(self, samples: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Copy of the newest samples (all that are held by default), oldest first. Safe to call while the reader
+        thread appends: samples it overwrites during the copy are dropped from the result."""
+        end = self.count
+        n = min(end, self.capacity if samples is None else min(samples, self.capacity))
+        start = end - n
+        index = np.arange(start, end) % self.capacity
+        columns = {name: column[index] for name, column in self.columns.items()}
+        overwritten = self.count - self.capacity - start
+        if overwritten > 0:
+            columns = {name: column[overwritten:] for name, column in columns.items()}
+        return columns
+
+
+class AxisRecorder:
+    node_id: Optional[int]
+    capacity: int
+    rings: Dict[str, MessageRing]
+
+    def __init__(self, capacity: int = DEFAULT_RECORD_CAPACITY):
+        self.node_id = None
+        self.capacity = capacity
+        self.rings = {name: MessageRing(signals, capacity) for name, signals in RECORDED_SIGNALS.items()}
+        self._dispatcher = None
+        # bound once, so that detach() unsubscribes the same callbacks attach() subscribed
+        self._handlers = {name: ring.append for name, ring in self.rings.items()}
+
+    def attach(self, dispatcher: CANDispatcher, node_id: int):
+        self.detach()
+        self._dispatcher = dispatcher
+        self.node_id = node_id
+        for name, handler in self._handlers.items():
+            dispatcher.subscribe(node_id, dispatcher.codec[name].cmd_id, handler)
+
+    def detach(self):
+        if self._dispatcher is None:
+            return
+        for name, handler in self._handlers.items():
+            self._dispatcher.unsubscribe(self.node_id, self._dispatcher.codec[name].cmd_id, handler)
+        self._dispatcher = None
+
+    @property
+    def recording(self) -> bool:
+        return self._dispatcher is not None
+
+    def snapshot(self, samples: Optional[int] = None) -> Dict[str, Any]:
+        """The newest samples of every message as lists, with how many were received and how many were overwritten."""
+        snapshot = {}
+        for name, ring in self.rings.items():
+            columns = ring.window(samples)
+            snapshot[name] = {column: values.tolist() for column, values in columns.items()}
+            snapshot[name]['count'] = ring.count
+            snapshot[name]['overwritten'] = max(0, ring.count - ring.capacity)
+        return snapshot
+
+    def export(self, path: str) -> str:
+        """Write every held sample to an uncompressed .npz, one array per column named '<message>.<column>'. Blocking."""
+        arrays = {'node_id': np.array(-1 if self.node_id is None else self.node_id)}
+        for name, ring in self.rings.items():
+            arrays.update({f"{name}.{column}": values for column, values in ring.window().items()})
+        with open(path, 'wb') as npz_file:
+            np.savez(npz_file, **arrays)
+        return path
+
@@ -0,0 +1,70 @@
+"""
+Cyclic setpoint streaming. The controller is configured once, then a python-can periodic task (a kernel
+broadcast manager task on socketcan) retransmits the latest setpoint frame at a fixed rate, and each new
+setpoint only swaps the frame's payload. A stream with a timeout is a dead-man switch: once no setpoint has
+arrived within it, the owner replaces the setpoint with one that holds the motor, until the next one arrives.
+"""
+
+from typing import Any, Dict, Optional
+import time
+
+import can
+
+from .codec import MessageCodec
+from .dispatcher import CANDispatcher
+
+# mode -> (Set_Controller_Mode payload, setpoint message)
+STREAM_MODES = {
+    "velocity": ({'Control_Mode': 0x02, 'Input_Mode': 0x01}, 'Set_Input_Vel'),
+    "torque": ({'Control_Mode': 0x01, 'Input_Mode': 0x01}, 'Set_Input_Torque'),
+    "position": ({'Control_Mode': 0x03, 'Input_Mode': 0x01}, 'Set_Input_Pos'),
+}
+DEFAULT_STREAM_RATE = 100.0
+# how many times per timeout a stream with one is checked
+STREAM_TIMEOUT_CHECKS = 4
+
+
+class SetpointStream:
+    mode: str
+    rate: float
+    timeout: Optional[float]
+    updated: float
+    timed_out: bool
+
+    def __init__(self, dispatcher: CANDispatcher, mode: str, arbitration_id: int, codec: MessageCodec, rate: float,
+                 timeout: Optional[float] = None):
+        self.mode = mode
+        self.rate = rate
+        self.timeout = timeout
+        self.updated = time.monotonic()
+        self.timed_out = False
+        self._dispatcher = dispatcher
+        self._arbitration_id = arbitration_id
+        self._codec = codec
+        self._task: Optional[can.ModifiableCyclicTaskABC] = None
+
+    def start(self, data: Dict[str, Any]):
+        self._task = self._dispatcher.send_periodic(self._message(data), 1.0 / self.rate)
+        self.updated = time.monotonic()
+
+    def update(self, data: Dict[str, Any]):
+        self._task.modify_data(self._message(data))
+        self.updated = time.monotonic()
+        self.timed_out = False
+
+    def expired(self) -> bool:
+        """Whether the timeout has passed since the last setpoint, and the stream has not been held since."""
+        return self.timeout is not None and not self.timed_out and time.monotonic() - self.updated > self.timeout
+
+    def hold(self, data: Dict[str, Any]):
+        """Replace the setpoint after a timeout, without counting as a new setpoint."""
+        self._task.modify_data(self._message(data))
+        self.timed_out = True
+
+    def stop(self):
+        if self._task is not None:
+            self._task.stop()
+            self._task = None
+
+    def _message(self, data: Dict[str, Any]) -> can.Message:
+        return can.Message(arbitration_id=self._arbitration_id, is_extended_id=False, data=self._codec.encode(data))
@@ -0,0 +1,150 @@
+"""
+Latest-value telemetry store for a single ODrive axis, kept current by the CAN dispatcher.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import time
+
+from .dispatcher import CANDispatcher
+
+HEARTBEAT = 'Heartbeat'
+ENCODER_ESTIMATES = 'Get_Encoder_Estimates'
+IQ = 'Get_Iq'
+VBUS_VOLTAGE = 'Get_Vbus_Voltage'
+MOTOR_ERROR = 'Get_Motor_Error'
+ENCODER_ERROR = 'Get_Encoder_Error'
+SENSORLESS_ERROR = 'Get_Sensorless_Error'
+# Axis_State the heartbeat reports once the axis is enabled
+CLOSED_LOOP_CONTROL = 0x08
+# messages the ODrive sends in reply to a remote (RTR) request, so they can be fetched when their cyclic rate is 0
+REQUESTABLE = (ENCODER_ESTIMATES, IQ, VBUS_VOLTAGE, MOTOR_ERROR, ENCODER_ERROR, SENSORLESS_ERROR)
+
+
+class AxisTelemetry:
+    position: Optional[float]
+    velocity: Optional[float]
+    axis_state: Optional[int]
+    axis_error: Optional[int]
+    trajectory_done: Optional[bool]
+    iq_setpoint: Optional[float]
+    iq_measured: Optional[float]
+    vbus: Optional[float]
+    motor_error: Optional[int]
+    encoder_error: Optional[int]
+    sensorless_error: Optional[int]
+    timestamps: Dict[str, Optional[float]]
+
+    def __init__(self):
+        self.position = None
+        self.velocity = None
+        self.axis_state = None
+        self.axis_error = None
+        self.trajectory_done = None
+        self.iq_setpoint = None
+        self.iq_measured = None
+        self.vbus = None
+        self.motor_error = None
+        self.encoder_error = None
+        self.sensorless_error = None
+        self.timestamps = {HEARTBEAT: None, ENCODER_ESTIMATES: None, IQ: None, VBUS_VOLTAGE: None, MOTOR_ERROR: None,
+                           ENCODER_ERROR: None, SENSORLESS_ERROR: None}
+        self._dispatcher = None
+        self._node_id = None
+        self._listeners: List[Callable[[], None]] = []
+        self._handlers = {
+            HEARTBEAT: self._on_heartbeat,
+            ENCODER_ESTIMATES: self._on_encoder_estimates,
+            IQ: self._on_iq,
+            VBUS_VOLTAGE: self._on_vbus_voltage,
+            MOTOR_ERROR: self._on_motor_error,
+            ENCODER_ERROR: self._on_encoder_error,
+            SENSORLESS_ERROR: self._on_sensorless_error,
+        }
+
+    def attach(self, dispatcher: CANDispatcher, node_id: int):
+        self.detach()
+        self._dispatcher = dispatcher
+        self._node_id = node_id
+        for name, handler in self._handlers.items():
+            dispatcher.subscribe(node_id, dispatcher.codec[name].cmd_id, handler)
+
+    def detach(self):
+        if self._dispatcher is None:
+            return
+        for name, handler in self._handlers.items():
+            self._dispatcher.unsubscribe(self._node_id, self._dispatcher.codec[name].cmd_id, handler)
+        self._dispatcher = None
+        self._node_id = None
+
+    def add_listener(self, listener: Callable[[], None]):
+        """Call listener from the CAN reader thread after every heartbeat or encoder estimate update."""
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[], None]):
+        self._listeners = [l for l in self._listeners if l is not listener]
+
+    def age(self, name: str) -> Optional[float]:
+        """Seconds since the last frame of the given message was received, or None if none has been."""
+        timestamp = self.timestamps[name]
+        if timestamp is None:
+            return None
+        return time.time() - timestamp
+
+    def is_stale(self, name: str, max_age: float) -> bool:
+        age = self.age(name)
+        return age is None or age > max_age
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "position": self.position,
+            "velocity": self.velocity,
+            "axis_state": self.axis_state,
+            "axis_error": self.axis_error,
+            "trajectory_done": self.trajectory_done,
+            "iq_setpoint": self.iq_setpoint,
+            "iq_measured": self.iq_measured,
+            "vbus": self.vbus,
+            "motor_error": self.motor_error,
+            "encoder_error": self.encoder_error,
+            "sensorless_error": self.sensorless_error,
+            "age": {name: self.age(name) for name in self.timestamps},
+        }
+
+    def _on_heartbeat(self, decoded: Dict[str, Any], timestamp: float):
+        self.axis_state = decoded['Axis_State']
+        self.axis_error = decoded['Axis_Error']
+        # firmware 0.6 reports Trajectory_Done_Flag in bit 48, which the legacy DBC names Encoder_Flags
+        self.trajectory_done = bool(decoded['Encoder_Flags'] & 0x1)
+        self.timestamps[HEARTBEAT] = timestamp
+        self._notify()
+
+    def _on_encoder_estimates(self, decoded: Dict[str, Any], timestamp: float):
+        self.position = decoded['Pos_Estimate']
+        self.velocity = decoded['Vel_Estimate']
+        self.timestamps[ENCODER_ESTIMATES] = timestamp
+        self._notify()
+
+    def _on_iq(self, decoded: Dict[str, Any], timestamp: float):
+        self.iq_setpoint = decoded['Iq_Setpoint']
+        self.iq_measured = decoded['Iq_Measured']
+        self.timestamps[IQ] = timestamp
+
+    def _on_vbus_voltage(self, decoded: Dict[str, Any], timestamp: float):
+        self.vbus = decoded['Vbus_Voltage']
+        self.timestamps[VBUS_VOLTAGE] = timestamp
+
+    def _on_motor_error(self, decoded: Dict[str, Any], timestamp: float):
+        self.motor_error = decoded['Motor_Error']
+        self.timestamps[MOTOR_ERROR] = timestamp
+
+    def _on_encoder_error(self, decoded: Dict[str, Any], timestamp: float):
+        self.encoder_error = decoded['Encoder_Error']
+        self.timestamps[ENCODER_ERROR] = timestamp
+
+    def _on_sensorless_error(self, decoded: Dict[str, Any], timestamp: float):
+        self.sensorless_error = decoded['Sensorless_Error']
+        self.timestamps[SENSORLESS_ERROR] = timestamp
+
+    def _notify(self):
+        for listener in self._listeners:
+            listener()
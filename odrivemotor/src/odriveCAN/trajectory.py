@@ -0,0 +1,185 @@
+"""
+Client side multi-waypoint trajectories. A time parameterised profile through every waypoint is planned up front
+with NumPy, limiting velocity and acceleration per segment and carrying speed through waypoints that continue in
+the same direction, then streamed to the ODrive as Set_Input_Pos frames with velocity and torque feed forward at a
+fixed rate, so segments blend without stopping.
+"""
+
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+import asyncio
+import math
+
+import numpy as np
+
+import can
+from viam.logging import getLogger
+
+from .codec import MessageCodec
+from .dispatcher import CANDispatcher
+
+LOGGER = getLogger(__name__)
+MINUTE_TO_SECOND = 60.0
+# Vel_FF and Torque_FF are sent as int16 with a 0.001 scale
+FEED_FORWARD_LIMIT = 32.767
+
+# (position in revolutions, velocity limit in revolutions/s, acceleration limit in revolutions/s^2)
+Waypoint = Tuple[float, float, float]
+
+
+class Profile:
+    """Position, velocity and acceleration of a trajectory sampled at a fixed rate, starting at time 0."""
+    time: np.ndarray
+    position: np.ndarray
+    velocity: np.ndarray
+    acceleration: np.ndarray
+
+    def __init__(self, time: np.ndarray, position: np.ndarray, velocity: np.ndarray, acceleration: np.ndarray):
+        self.time = time
+        self.position = position
+        self.velocity = velocity
+        self.acceleration = acceleration
+
+    @property
+    def duration(self) -> float:
+        return float(self.time[-1])
+
+
+def parse_waypoints(waypoints: Sequence[Any], rpm: Optional[float] = None, rpm_per_sec: Optional[float] = None) -> List[Waypoint]:
+    """Waypoints are positions in revolutions, or {"position": ..., "rpm": ..., "rpm_per_sec": ...} to override the
+    trajectory's velocity and acceleration limits for the segment that ends at that waypoint."""
+    parsed = []
+    for waypoint in waypoints:
+        if not isinstance(waypoint, Mapping):
+            waypoint = {"position": waypoint}
+        vel_limit = waypoint.get("rpm", rpm)
+        accel_limit = waypoint.get("rpm_per_sec", rpm_per_sec)
+        if vel_limit is None or accel_limit is None or vel_limit <= 0 or accel_limit <= 0:
+            raise ValueError("every waypoint needs a positive rpm and rpm_per_sec, set on the trajectory or the waypoint")
+        parsed.append((float(waypoint["position"]), vel_limit / MINUTE_TO_SECOND, accel_limit / MINUTE_TO_SECOND))
+    if not parsed:
+        raise ValueError("a trajectory needs at least one waypoint")
+    return parsed
+
+
+def parse_rate(rate: Any) -> float:
+    """The rate in Hz a trajectory is sampled and streamed at, which must be a positive finite number."""
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not math.isfinite(rate) or rate <= 0:
+        raise ValueError(f"rate_hz must be a positive number, got {rate}")
+    return float(rate)
+
+
+def plan_profile(start: float, waypoints: List[Waypoint], rate: float) -> Profile:
+    """Plan a profile from start through every waypoint, ending at rest on the last one, sampled at rate Hz."""
+    rate = parse_rate(rate)
+    positions = np.array([start] + [waypoint[0] for waypoint in waypoints])
+    vel_limit = np.array([waypoint[1] for waypoint in waypoints])
+    accel_limit = np.array([waypoint[2] for waypoint in waypoints])
+    steps = np.diff(positions)
+    moving = steps != 0
+    steps, vel_limit, accel_limit = steps[moving], vel_limit[moving], accel_limit[moving]
+    if len(steps) == 0:
+        return Profile(np.zeros(1), np.array([start]), np.zeros(1), np.zeros(1))
+    direction = np.sign(steps)
+    distance = np.abs(steps)
+
+    # speed through each waypoint: zero where the direction reverses and at both ends, then lowered until every
+    # segment can reach the next junction's speed within its acceleration limit, forwards and backwards
+    junction = np.zeros(len(steps) + 1)
+    junction[1:-1] = np.where(direction[:-1] == direction[1:], np.minimum(vel_limit[:-1], vel_limit[1:]), 0.0)
+    reach = 2 * accel_limit * distance
+    for i in range(len(steps)):
+        junction[i + 1] = min(junction[i + 1], math.sqrt(junction[i] ** 2 + reach[i]))
+    for i in reversed(range(len(steps))):
+        junction[i] = min(junction[i], math.sqrt(junction[i + 1] ** 2 + reach[i]))
+
+    # every segment accelerates to its peak speed, cruises, then decelerates to the next junction's speed
+    v0, v1 = junction[:-1], junction[1:]
+    peak = np.minimum(vel_limit, np.sqrt((reach + v0 ** 2 + v1 ** 2) / 2))
+    accel_distance = (peak ** 2 - v0 ** 2) / (2 * accel_limit)
+    decel_distance = (peak ** 2 - v1 ** 2) / (2 * accel_limit)
+    cruise_time = np.maximum(distance - accel_distance - decel_distance, 0.0) / peak
+
+    # phases, three per segment, as (duration, start velocity, acceleration, distance) along the segment's direction
+    durations = np.stack([(peak - v0) / accel_limit, cruise_time, (peak - v1) / accel_limit], axis=1).ravel()
+    phase_velocity = (np.stack([v0, peak, peak], axis=1) * direction[:, None]).ravel()
+    phase_accel = (np.stack([accel_limit, np.zeros_like(peak), -accel_limit], axis=1) * direction[:, None]).ravel()
+    phase_distance = phase_velocity * durations + 0.5 * phase_accel * durations ** 2
+    phase_start = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    phase_position = start + np.concatenate([[0.0], np.cumsum(phase_distance)[:-1]])
+    duration = float(np.sum(durations))
+
+    time = np.arange(int(math.ceil(duration * rate)) + 1) / rate
+    time[-1] = duration
+    phase = np.searchsorted(phase_start, time, side="right") - 1
+    elapsed = time - phase_start[phase]
+    velocity = phase_velocity[phase] + phase_accel[phase] * elapsed
+    position = phase_position[phase] + phase_velocity[phase] * elapsed + 0.5 * phase_accel[phase] * elapsed ** 2
+    acceleration = phase_accel[phase]
+    position[-1], velocity[-1], acceleration[-1] = positions[-1], 0.0, 0.0
+    return Profile(time, position, velocity, acceleration)
+
+
+class TrajectoryStream:
+    """Sends one precomputed Set_Input_Pos frame per sample on the event loop. Samples are timed from the start of
+    the stream, so a late loop skips ahead instead of drifting, and the last sample is always sent."""
+    mode = "trajectory"
+    rate: float
+    profile: Profile
+    skipped: int
+
+    def __init__(self, dispatcher: CANDispatcher, arbitration_id: int, codec: MessageCodec, profile: Profile, rate: float,
+                 inertia: float = 0.0):
+        self.rate = rate
+        self.profile = profile
+        self.skipped = 0
+        self._dispatcher = dispatcher
+        velocity = np.clip(profile.velocity, -FEED_FORWARD_LIMIT, FEED_FORWARD_LIMIT)
+        # inertia is in kg m^2 and acceleration in revolutions/s^2
+        torque = np.clip(inertia * 2 * math.pi * profile.acceleration, -FEED_FORWARD_LIMIT, FEED_FORWARD_LIMIT)
+        self._messages = [can.Message(arbitration_id=arbitration_id, is_extended_id=False,
+                                      data=codec.encode({'Input_Pos': p, 'Vel_FF': v, 'Torque_FF': t}))
+                          for p, v, t in zip(profile.position.tolist(), velocity.tolist(), torque.tolist())]
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._play())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the last sample to be sent. Returns False if the stream stopped early or timeout passed."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # the stream was stopped; a cancelled caller is passed on
+            if not self._task.cancelled():
+                raise
+            return False
+        return not self._task.cancelled() and self._task.result()
+
+    async def _play(self) -> bool:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        last = len(self._messages) - 1
+        i = 0
+        while True:
+            try:
+                self._dispatcher.send(self._messages[i])
+            except can.CanError as e:
+                LOGGER.error(f"trajectory stopped after {i} of {last + 1} setpoints: {e}")
+                return False
+            if i == last:
+                return True
+            i += 1
+            delay = started + self.profile.time[i] - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            due = min(last, int((loop.time() - started) * self.rate))
+            if due > i:
+                self.skipped += due - i
+                i = due
@@ -0,0 +1,12 @@
+"""
+This files OdriveCANGroup model with the Viam Registry. The model is imported when the first canbus_group component is
+created.
+"""
+
+from viam.resource.types import Model, ModelFamily
+from viam.components.generic import Generic
+from ..registration import register_lazily
+
+MODEL = Model(ModelFamily("viam", "odrive"), "canbus_group")
+
+register_lazily(Generic.SUBTYPE, MODEL, __name__ + ".odriveCANGroup", "OdriveCANGroup")
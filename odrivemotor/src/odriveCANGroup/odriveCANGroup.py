@@ -0,0 +1,224 @@
+from typing import ClassVar, Mapping, Any, Dict, Optional, List
+
+from typing_extensions import Self
+
+from viam.module.types import Reconfigurable
+from viam.proto.app.robot import ComponentConfig
+from viam.proto.common import ResourceName, Geometry
+from viam.resource.base import ResourceBase
+from viam.resource.types import Model
+
+from viam.components.generic import Generic
+from viam.logging import getLogger
+
+import asyncio
+import math
+
+from . import MODEL
+from ..odriveCAN.dispatcher import get_dispatcher, release_dispatcher, CANDispatcher
+from ..odriveCAN.codec import CANSimpleCodec
+from ..odriveCAN.telemetry import AxisTelemetry, HEARTBEAT, CLOSED_LOOP_CONTROL
+from ..odriveCAN.goal import MoveGoal
+from ..odriveCAN.odriveCAN import DEFAULT_CHANNEL, DEFAULT_INTERFACE, MESSAGE_TIMEOUT, MINUTE_TO_SECOND
+
+import can
+
+LOGGER = getLogger(__name__)
+STATE_TIMEOUT = 5.0
+
+# Several ODrives on one CAN interface commanded together: modes are staged on every axis first, then all
+# setpoints are sent in a single back-to-back burst so the axes start within a frame time of each other.
+class OdriveCANGroup(Generic, Reconfigurable):
+    MODEL: ClassVar[Model] = MODEL
+    nodeIDs: List[int]
+    codec: CANSimpleCodec
+    dispatcher: CANDispatcher
+    telemetry: Dict[int, AxisTelemetry]
+    goals: Dict[int, MoveGoal]
+    closed: bool
+
+    @classmethod
+    def new(cls, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]) -> Self:
+        group = cls(config.name)
+        group.closed = False
+        group.nodeIDs = []
+        group.telemetry = {}
+        group.goals = {}
+        channel = config.attributes.fields["canbus_channel"].string_value or DEFAULT_CHANNEL
+        interface = config.attributes.fields["canbus_interface"].string_value or DEFAULT_INTERFACE
+        group.dispatcher = get_dispatcher(channel, interface)
+        try:
+            group.codec = group.dispatcher.codec
+            group.set_node_ids(config)
+        except Exception:
+            # nothing owns the subscriptions or the reference to the CAN interface until new() returns
+            group.release()
+            raise
+        return group
+
+    @classmethod
+    def validate(cls, config: ComponentConfig):
+        return
+
+    def reconfigure(self, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]):
+        channel = config.attributes.fields["canbus_channel"].string_value or DEFAULT_CHANNEL
+        interface = config.attributes.fields["canbus_interface"].string_value or DEFAULT_INTERFACE
+        if (channel, interface) != (self.dispatcher.channel, self.dispatcher.interface):
+            self.set_dispatcher(get_dispatcher(channel, interface))
+        self.set_node_ids(config)
+
+    # Moves every axis to another CAN interface, and releases the one the group used.
+    def set_dispatcher(self, dispatcher: CANDispatcher):
+        previous = self.dispatcher
+        self.dispatcher = dispatcher
+        self.codec = dispatcher.codec
+        for nodeID in self.nodeIDs:
+            self.cancel_goal(nodeID)
+            self.telemetry[nodeID].attach(dispatcher, nodeID)
+        release_dispatcher(previous)
+
+    def set_node_ids(self, config: ComponentConfig):
+        if "canbus_node_ids" not in config.attributes.fields:
+            LOGGER.error("'canbus_node_ids' is a required config attribute")
+        nodeIDs = [int(value.number_value) for value in config.attributes.fields["canbus_node_ids"].list_value.values]
+        for nodeID in self.nodeIDs:
+            if nodeID not in nodeIDs:
+                self.cancel_goal(nodeID)
+                self.telemetry.pop(nodeID).detach()
+        for nodeID in nodeIDs:
+            if nodeID not in self.telemetry:
+                self.telemetry[nodeID] = AxisTelemetry()
+                self.telemetry[nodeID].attach(self.dispatcher, nodeID)
+        self.nodeIDs = nodeIDs
+
+    async def close(self):
+        self.release()
+
+    # Detaches every axis, including those of a set_node_ids() that failed part way, and drops the group's
+    # reference to the CAN interface.
+    def release(self):
+        if self.closed:
+            return
+        self.closed = True
+        for nodeID in list(self.telemetry):
+            self.cancel_goal(nodeID)
+            self.telemetry[nodeID].detach()
+        release_dispatcher(self.dispatcher)
+
+    async def do_command(self, command: Mapping[str, Any], *, timeout: Optional[float] = None, **kwargs) -> Mapping[str, Any]:
+        result = {}
+        if "set_rpm" in command:
+            await self.set_rpm(command["set_rpm"])
+            result["set_rpm"] = True
+        if "go_for" in command:
+            result["go_for"] = await self.go_for(command["go_for"]["rpm"], command["go_for"]["revolutions"],
+                                                 command["go_for"].get("wait", False))
+        if "stop" in command:
+            await self.stop()
+            result["stop"] = True
+        if "positions" in command:
+            result["positions"] = {str(nodeID): self.telemetry[nodeID].position for nodeID in self.nodeIDs}
+        return result
+
+    async def get_geometries(self) -> List[Geometry]:
+        pass
+
+    # rpm is a list with one entry per node id in canbus_node_ids
+    async def set_rpm(self, rpm: List[float]):
+        self.check_axis_count(rpm)
+        for nodeID in self.nodeIDs:
+            self.cancel_goal(nodeID)
+        await self.stage({'Control_Mode': 0x02, 'Input_Mode': 0x01})
+        self.dispatcher.send_burst([self.message(nodeID, 'Set_Input_Vel', {'Input_Vel': value / MINUTE_TO_SECOND, 'Input_Torque_FF': 0})
+                                    for nodeID, value in zip(self.nodeIDs, rpm)])
+
+    # rpm and revolutions are lists with one entry per node id in canbus_node_ids. Returns whether each axis
+    # reached its goal when wait is set.
+    async def go_for(self, rpm: List[float], revolutions: List[float], wait: bool) -> Dict[str, bool]:
+        self.check_axis_count(rpm)
+        self.check_axis_count(revolutions)
+        for nodeID, value in zip(self.nodeIDs, rpm):
+            if abs(value) < 0.001:
+                raise ValueError(f"cannot move node {nodeID} at an RPM that is nearly 0")
+        for nodeID in self.nodeIDs:
+            if self.telemetry[nodeID].position is None:
+                raise ValueError(f"no position estimates received from node {nodeID}")
+            self.cancel_goal(nodeID)
+        await self.stage({'Control_Mode': 0x03, 'Input_Mode': 0x05},
+                         {nodeID: abs(value / MINUTE_TO_SECOND) for nodeID, value in zip(self.nodeIDs, rpm)})
+
+        msgs = []
+        goals = []
+        for nodeID, axis_rpm, axis_revolutions in zip(self.nodeIDs, rpm, revolutions):
+            goal_position = self.telemetry[nodeID].position + math.copysign(axis_revolutions, axis_rpm)
+            goals.append(self.start_goal(nodeID, goal_position))
+            msgs.append(self.message(nodeID, 'Set_Input_Pos', {'Input_Pos': goal_position, 'Vel_FF': 0, 'Torque_FF': 0}))
+        self.dispatcher.send_burst(msgs)
+
+        if not wait:
+            return {}
+        timeouts = [abs(value / (axis_rpm / MINUTE_TO_SECOND)) * 2 + MESSAGE_TIMEOUT for axis_rpm, value in zip(rpm, revolutions)]
+        reached = await asyncio.gather(*[goal.wait(t) for goal, t in zip(goals, timeouts)])
+        return {str(nodeID): value for nodeID, value in zip(self.nodeIDs, reached)}
+
+    async def stop(self):
+        for nodeID in self.nodeIDs:
+            self.cancel_goal(nodeID)
+            self.dispatcher.clear_shadow(nodeID)
+        self.dispatcher.send_burst([self.message(nodeID, 'Set_Axis_State', {'Axis_Requested_State': 0x01}) for nodeID in self.nodeIDs])
+
+    # Sends the controller mode, trajectory limits and closed loop request to every axis, then waits for all of
+    # them to report closed loop control so the setpoint burst that follows is not held up by any single axis.
+    # If any axis does not get there, every axis is set to idle and no setpoints are sent, since the group moves
+    # together. The shadow a canbus motor on the same node keeps is cleared, so that it resends its own configuration.
+    async def stage(self, controller_mode: Dict[str, int], traj_vel_limits: Optional[Dict[int, float]] = None):
+        msgs = []
+        for nodeID in self.nodeIDs:
+            self.dispatcher.clear_shadow(nodeID)
+            msgs.append(self.message(nodeID, 'Set_Controller_Mode', controller_mode))
+            if traj_vel_limits is not None:
+                msgs.append(self.message(nodeID, 'Set_Traj_Vel_Limit', {'Traj_Vel_Limit': traj_vel_limits[nodeID]}))
+            msgs.append(self.message(nodeID, 'Set_Axis_State', {'Axis_Requested_State': 0x08}))
+        self.dispatcher.send_burst(msgs)
+        reached = await asyncio.gather(*[self.wait_until_correct_state(nodeID, CLOSED_LOOP_CONTROL) for nodeID in self.nodeIDs])
+        failed = [nodeID for nodeID, ok in zip(self.nodeIDs, reached) if not ok]
+        if failed:
+            await self.stop()
+            raise TimeoutError(f"nodes {failed} did not enter closed loop control within {STATE_TIMEOUT}s, every axis was set to idle")
+
+    async def wait_until_correct_state(self, nodeID, state) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STATE_TIMEOUT
+        while loop.time() < deadline:
+            heartbeat = await self.dispatcher.wait_for(nodeID, self.codec[HEARTBEAT].cmd_id, deadline - loop.time())
+            if heartbeat is not None and heartbeat['Axis_State'] == state:
+                return True
+        LOGGER.error(f"Unable to set node {nodeID} to requested state")
+        return False
+
+    def start_goal(self, nodeID, position):
+        goal = MoveGoal(self.telemetry[nodeID], position)
+        self.goals[nodeID] = goal
+        self.telemetry[nodeID].add_listener(goal.check)
+        asyncio.create_task(self.stop_at_goal(nodeID, goal))
+        return goal
+
+    def cancel_goal(self, nodeID):
+        goal = self.goals.pop(nodeID, None)
+        if goal is not None:
+            self.telemetry[nodeID].remove_listener(goal.check)
+            goal.cancel()
+
+    async def stop_at_goal(self, nodeID, goal: MoveGoal):
+        if await goal.wait() and self.goals.get(nodeID) is goal:
+            self.cancel_goal(nodeID)
+            self.dispatcher.clear_shadow(nodeID)
+            self.dispatcher.send(self.message(nodeID, 'Set_Axis_State', {'Axis_Requested_State': 0x01}))
+
+    def check_axis_count(self, values: List[float]):
+        if len(values) != len(self.nodeIDs):
+            raise ValueError(f"expected {len(self.nodeIDs)} values, one per node in canbus_node_ids, got {len(values)}")
+
+    def message(self, nodeID, name, data) -> can.Message:
+        return can.Message(arbitration_id=self.codec.arbitration_ids(nodeID)[name], is_extended_id=False,
+                           data=self.codec[name].encode(data))
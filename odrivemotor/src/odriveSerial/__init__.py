@@ -1,9 +1,11 @@
 """
-This files OdriveSerial model with the Viam Registry.
+This files OdriveSerial model with the Viam Registry. The model is imported when the first serial component is created.
 """
 
-from viam.resource.registry import Registry, ResourceCreatorRegistration
+from viam.resource.types import Model, ModelFamily
 from viam.components.motor import Motor
-from .odriveSerial import OdriveSerial
+from ..registration import register_lazily
 
-Registry.register_resource_creator(Motor.SUBTYPE, OdriveSerial.MODEL, ResourceCreatorRegistration(OdriveSerial.new, OdriveSerial.validate))
+MODEL = Model(ModelFamily("viam", "odrive"), "serial")
+
+register_lazily(Motor.SUBTYPE, MODEL, __name__ + ".odriveSerial", "OdriveSerial")
@@ -6,30 +6,47 @@ from viam.module.types import Reconfigurable
 from viam.proto.app.robot import ComponentConfig
 from viam.proto.common import ResourceName, Geometry
 from viam.resource.base import ResourceBase
-from viam.resource.types import Model, ModelFamily
+from viam.resource.types import Model
 
 from viam.components.motor import Motor
 from viam.logging import getLogger
 
-import odrive
 from odrive.enums import *
-from threading import Thread
 import asyncio
-import time
+import json
 import math
+import time
+from . import MODEL
 from ..utils import set_configs
+from ..scheduler import PeriodicScheduler
+from ..discovery import connect_odrive, DEFAULT_CONNECT_TIMEOUT
+from ..metrics import Metrics, timed
+from ..odriveCAN.goal import GOAL_POSITION_TOLERANCE, GOAL_VELOCITY_TOLERANCE
+from .transport import SerialTransport
 
 LOGGER = getLogger(__name__)
 MINUTE_TO_SECOND = 60
+DEFAULT_ERROR_CHECK_PERIOD = 1.0
+DEFAULT_TELEMETRY_POLL_PERIOD = 0.02
+STATE_TIMEOUT = 60
+# consecutive failed telemetry polls after which the ODrive is taken to be disconnected
+MAX_POLL_FAILURES = 25
 
 class OdriveSerial(Motor, Reconfigurable):
-    MODEL: ClassVar[Model] = Model(ModelFamily("viam", "odrive"), "serial")
+    MODEL: ClassVar[Model] = MODEL
     serial_number: str
     odrive_config_file: str
     torque_constant: float
     current_lim: float
     offset: float
     odrv: Any
+    transport: Optional[SerialTransport]
+    scheduler: PeriodicScheduler
+    shadow: Dict[str, Any]
+    connect_timeout: float
+    connection: asyncio.Task
+    metrics: Metrics
+    poll_failures: int
 
     @classmethod
     def new(cls, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]) -> Self:
@@ -37,28 +54,18 @@ class OdriveSerial(Motor, Reconfigurable):
         odriveSerial.serial_number = config.attributes.fields["serial_number"].string_value
         odriveSerial.odrive_config_file = config.attributes.fields["odrive_config_file"].string_value
         odriveSerial.offset = 0
+        odriveSerial.shadow = {}
+        odriveSerial.transport = None
+        odriveSerial.poll_failures = 0
+        odriveSerial.metrics = Metrics()
+        odriveSerial.scheduler = PeriodicScheduler()
+        odriveSerial.set_connect_timeout(config)
+        odriveSerial.schedule_periodic_jobs(config)
 
         if odriveSerial.serial_number == "":
             LOGGER.warning("If you are using multiple Odrive controllers, make sure to add their respective serial_number to each component attributes")
-            odriveSerial.odrv = odrive.find_any()
-        else:
-            odriveSerial.serial_number = odrive.find_any(serial_number = odriveSerial.serial_number)
-        odriveSerial.odrv.clear_errors()
-        
-        if odriveSerial.odrive_config_file != "":
-            set_configs(odriveSerial.odrv, odriveSerial.odrive_config_file)
-        
-        odriveSerial.torque_constant = odriveSerial.odrv.axis0.config.motor.torque_constant
-        odriveSerial.current_lim = odriveSerial.odrv.axis0.config.general_lockin.current
-
-        def periodically_surface_errors(odrv):
-            while True:
-                asyncio.run(odrv.surface_errors())
-                time.sleep(1)
-
-        thread = Thread(target = periodically_surface_errors, args=[odriveSerial])
-        thread.setDaemon(True) 
-        thread.start()
+        # the ODrive is found and configured in the background so that components do not wait on each other
+        odriveSerial.connection = asyncio.get_running_loop().create_task(odriveSerial.connect())
 
         return odriveSerial
 
@@ -67,99 +74,278 @@ class OdriveSerial(Motor, Reconfigurable):
         return
 
     def reconfigure(self, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]):
-        self.serial_number = config.attributes.fields["serial_number"].string_value
-        
+        serial_number = config.attributes.fields["serial_number"].string_value
         config_file = config.attributes.fields["odrive_config_file"].string_value
+        reconnect = serial_number != self.serial_number
         if (config_file != self.odrive_config_file) and config_file != "":
             LOGGER.info("Updating odrive configurations.")
-            self.odrive_config_file = config_file
-            set_configs(self.odrv, self.odrive_config_file)
-            self.torque_constant = self.odrv.axis0.config.motor.torque_constant
-            self.current_lim = self.odrv.axis0.config.general_lockin.current
+            reconnect = True
+        self.serial_number = serial_number
+        self.odrive_config_file = config_file or self.odrive_config_file
+        self.set_connect_timeout(config)
+        self.schedule_periodic_jobs(config)
+
+        if reconnect:
+            self.connection.cancel()
+            self.disconnect()
+            self.connection = asyncio.get_running_loop().create_task(self.connect())
+
+    def set_connect_timeout(self, config: ComponentConfig):
+        self.connect_timeout = DEFAULT_CONNECT_TIMEOUT
+        if config.attributes.fields["connect_timeout"].number_value > 0:
+            self.connect_timeout = config.attributes.fields["connect_timeout"].number_value
+
+    def schedule_periodic_jobs(self, config: ComponentConfig):
+        self.error_check_period = DEFAULT_ERROR_CHECK_PERIOD
+        if config.attributes.fields["error_check_period"].number_value > 0:
+            self.error_check_period = config.attributes.fields["error_check_period"].number_value
+        self.telemetry_poll_period = DEFAULT_TELEMETRY_POLL_PERIOD
+        if config.attributes.fields["telemetry_poll_period"].number_value > 0:
+            self.telemetry_poll_period = config.attributes.fields["telemetry_poll_period"].number_value
+
+        # until the ODrive is connected there is nothing to poll; connect() starts the jobs once it is
+        if self.transport is not None:
+            self.scheduler.schedule("poll_telemetry", self.poll_telemetry, self.telemetry_poll_period)
+            self.scheduler.schedule("surface_errors", self.surface_errors, self.error_check_period)
+
+        if "metrics" in config.attributes.fields:
+            self.metrics.enabled = config.attributes.fields["metrics"].bool_value
+        if config.attributes.fields["metrics_dump_period"].number_value > 0:
+            self.scheduler.schedule("dump_metrics", self.dump_metrics, config.attributes.fields["metrics_dump_period"].number_value)
+        else:
+            self.scheduler.cancel("dump_metrics")
+
+    # Finds the ODrive through the shared discovery index and applies the config file on a connect thread, giving up
+    # after connect_timeout. A failed attempt is logged and retried by the next call that needs the ODrive.
+    async def connect(self):
+        def configure(odrv):
+            odrv.clear_errors()
+            if self.odrive_config_file != "":
+                set_configs(odrv, self.odrive_config_file)
+            return odrv.axis0.config.motor.torque_constant, odrv.axis0.config.general_lockin.current
 
+        try:
+            self.odrv, (self.torque_constant, self.current_lim) = await connect_odrive(self.serial_number, configure, self.connect_timeout)
+        except Exception as e:
+            LOGGER.error(f"Could not connect to odrive: {e}")
+            return
+        self.transport = SerialTransport(self.odrv)
+        self.poll_failures = 0
+        self.scheduler.schedule("poll_telemetry", self.poll_telemetry, self.telemetry_poll_period)
+        self.scheduler.schedule("surface_errors", self.surface_errors, self.error_check_period)
+
+    async def wait_until_connected(self):
+        if self.connection.done() and self.transport is None:
+            self.connection = asyncio.get_running_loop().create_task(self.connect())
+        # shielded so that a cancelled caller does not cancel a connection other callers are waiting on
+        await asyncio.shield(self.connection)
+        if self.transport is None:
+            raise ConnectionError(f"odrive '{self.serial_number}' is not connected")
+
+    # Only the jobs that use the connection stop until connect() restarts them; dump_metrics keeps running.
+    def disconnect(self):
+        self.scheduler.cancel("poll_telemetry")
+        self.scheduler.cancel("surface_errors")
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+        self.shadow = {}
+
+    # The telemetry poll and error check stop with the scheduler. The USB connection belongs to the odrive library's
+    # discovery and stays open for the next component that uses the ODrive.
+    async def close(self):
+        self.connection.cancel()
+        self.scheduler.cancel_all()
+        self.disconnect()
+
+    @timed
     async def set_power(self, power: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         if abs(power) < 0.001:
             LOGGER.error("Cannot move motor at a power percent that is nearly 0")
+        await self.configure_controller(ControlMode.TORQUE_CONTROL, InputMode.PASSTHROUGH)
         torque = power * self.current_lim * self.torque_constant
-        self.odrv.axis0.controller.config.input_mode = InputMode.PASSTHROUGH
-        self.odrv.axis0.controller.config.control_mode = ControlMode.TORQUE_CONTROL
-        self.odrv.axis0.requested_state = AxisState.CLOSED_LOOP_CONTROL
-        await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
         # the line below causes motion.
-        self.odrv.axis0.controller.input_torque = torque
+        await self.transport.write(self.transport.controller, "input_torque", torque)
 
+    @timed
     async def go_for(self, rpm: float, revolutions: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         if abs(rpm) < 0.001:
             LOGGER.error("Cannot move motor at an RPM that is nearly 0")
         rps = rpm / MINUTE_TO_SECOND
         await self.configure_trap_trajectory(abs(rpm))
         current_position = await self.get_position()
+        goal_position = current_position + math.copysign(revolutions, rpm) + self.offset
         # the line below causes motion.
-        self.odrv.axis0.controller.input_pos = current_position + math.copysign(revolutions, rpm) + self.offset
-        await self.wait_and_set_to_idle(rps, revolutions)
+        await self.transport.write(self.transport.controller, "input_pos", goal_position)
+        if extra is None or extra.get("wait", True):
+            await self.wait_and_set_to_idle(goal_position, abs(revolutions / rps) * 2 + 1)
 
+    @timed
     async def go_to(self, rpm: float, revolutions: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         current_position = await self.get_position()
         revolutions = revolutions - current_position
-        await self.go_for(rpm, revolutions)
+        await self.go_for(rpm, revolutions, extra)
 
+    @timed
     async def set_rpm(self, rpm: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         if abs(rpm) < 0.001:
             LOGGER.error("Cannot move motor at an RPM that is nearly 0")
         rps = rpm / MINUTE_TO_SECOND
-        self.odrv.axis0.controller.config.input_mode = InputMode.PASSTHROUGH
-        self.odrv.axis0.controller.config.control_mode = ControlMode.VELOCITY_CONTROL
-        self.odrv.axis0.requested_state = AxisState.CLOSED_LOOP_CONTROL
-        await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
-        self.odrv.axis0.controller.input_vel = rps
+        await self.configure_controller(ControlMode.VELOCITY_CONTROL, InputMode.PASSTHROUGH)
+        await self.transport.write(self.transport.controller, "input_vel", rps)
 
+    @timed
     async def reset_zero_position(self, offset: float, extra: Optional[Dict[str, Any]] = None, **kwargs):
         position = await self.get_position()
         self.offset += position
 
+    @timed
     async def get_position(self, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        return self.odrv.axis0.pos_vel_mapper.pos_rel - self.offset
+        await self.wait_for_fresh_telemetry(extra)
+        return self.transport["position"] - self.offset
 
     async def get_properties(self, extra: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, **kwargs) -> Motor.Properties:
         return Motor.Properties(position_reporting=True)
 
+    @timed
     async def stop(self, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.odrv.axis0.requested_state = AxisState.IDLE
+        self.shadow = {}
+        if self.transport is None:
+            return
+        await self.transport.write(self.transport.axis, "requested_state", AxisState.IDLE)
 
+    @timed
     async def is_powered(self, extra: Optional[Dict[str, Any]] = None, **kwargs) -> Tuple[bool, float]:
-        return (self.odrv.axis0.current_state != AxisState.IDLE and self.odrv.axis0.current_state != AxisState.UNDEFINED, self.odrv.axis0.motor.foc.Iq_setpoint/self.current_lim)
+        await self.wait_for_fresh_telemetry(extra)
+        current_state = self.transport["current_state"]
+        return (current_state != AxisState.IDLE and current_state != AxisState.UNDEFINED, self.transport["iq_setpoint"]/self.current_lim)
 
+    @timed
     async def is_moving(self):
-        return self.odrv.axis0.current_state != AxisState.IDLE
+        await self.wait_for_fresh_telemetry()
+        return self.transport["current_state"] != AxisState.IDLE
 
     async def get_geometries(self) -> List[Geometry] :
 	    pass
 
+    async def do_command(self, command: Mapping[str, Any], *, timeout: Optional[float] = None, **kwargs) -> Mapping[str, Any]:
+        result = {}
+        if "telemetry" in command:
+            await self.wait_until_connected()
+            result["telemetry"] = self.transport.snapshot()
+        if "metrics" in command:
+            options = command["metrics"] if isinstance(command["metrics"], Mapping) else {}
+            if options.get("reset", False):
+                self.metrics.reset()
+            if "enable" in options:
+                self.metrics.enabled = options["enable"]
+            result["metrics"] = self.metrics.snapshot()
+        return result
+
+    # A failed poll is only logged when it starts a run of failures, not every poll period. Once the ODrive has
+    # stopped answering for MAX_POLL_FAILURES polls it is dropped and found again, and until then getters wait in
+    # wait_until_connected rather than reading a cache that is no longer updated.
+    async def poll_telemetry(self):
+        started = time.perf_counter()
+        try:
+            await self.transport.poll()
+        except Exception as e:
+            self.metrics.increment("poll_errors")
+            self.poll_failures += 1
+            if self.poll_failures == 1:
+                LOGGER.warning(f"telemetry poll of odrive '{self.serial_number}' failed: {e}")
+            if self.poll_failures >= MAX_POLL_FAILURES:
+                LOGGER.error(f"odrive '{self.serial_number}' did not answer {self.poll_failures} telemetry polls, reconnecting")
+                self.disconnect()
+                self.connection = asyncio.get_running_loop().create_task(self.connect())
+            return
+        self.poll_failures = 0
+        self.metrics.observe("poll", time.perf_counter() - started)
+
+    async def dump_metrics(self):
+        LOGGER.info(f"metrics for odrive {self.serial_number}: {json.dumps(self.metrics.snapshot())}")
+
+    # Telemetry is served from the latest poll cycle. Callers that need a bound on its age can pass
+    # {"max_age": seconds} in extra, in which case a stale cache is refreshed by waiting for the next poll.
+    async def wait_for_fresh_telemetry(self, extra: Optional[Dict[str, Any]] = None):
+        await self.wait_until_connected()
+        age = self.transport.age()
+        if age is None or (extra is not None and "max_age" in extra and age > extra["max_age"]):
+            self.metrics.increment("telemetry_stale")
+            await self.transport.wait_for_poll(asyncio.get_running_loop().time(), STATE_TIMEOUT)
+        else:
+            self.metrics.observe("telemetry_age", age)
+
     async def configure_trap_trajectory(self, rpm) -> None:
         rps = rpm / MINUTE_TO_SECOND
-        self.odrv.axis0.trap_traj.config.vel_limit = rps
-        self.odrv.axis0.controller.config.input_mode = InputMode.TRAP_TRAJ
-        self.odrv.axis0.controller.config.control_mode = ControlMode.POSITION_CONTROL
-        self.odrv.axis0.requested_state = AxisState.CLOSED_LOOP_CONTROL
-        await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
+        await self.configure_controller(ControlMode.POSITION_CONTROL, InputMode.TRAP_TRAJ, rps)
+
+    # The shadow holds the controller configuration last written to the ODrive. It is only trusted while the axis
+    # is still in the closed loop control this driver put it in, so an error, a stop or a reboot makes the next
+    # command write the full configuration again.
+    async def configure_controller(self, control_mode, input_mode, traj_vel_limit=None):
+        await self.wait_until_connected()
+        if not (self.shadow.get("closed_loop", False) and self.transport["current_state"] == AxisState.CLOSED_LOOP_CONTROL):
+            self.shadow = {}
+        if traj_vel_limit is not None:
+            await self.write_if_changed(self.transport.trap_traj_config, "vel_limit", traj_vel_limit)
+        await self.write_if_changed(self.transport.controller_config, "input_mode", input_mode)
+        await self.write_if_changed(self.transport.controller_config, "control_mode", control_mode)
+        if not self.shadow.get("closed_loop", False):
+            await self.transport.write(self.transport.axis, "requested_state", AxisState.CLOSED_LOOP_CONTROL)
+            self.shadow["closed_loop"] = await self.wait_until_correct_state(AxisState.CLOSED_LOOP_CONTROL)
+
+    async def write_if_changed(self, handle, prop, value):
+        key = (id(handle), prop)
+        if self.shadow.get(key) != value:
+            await self.transport.write(handle, prop, value)
+            self.shadow[key] = value
+        else:
+            self.metrics.increment("shadow_skipped")
     
+    # Waits on poll cycles that started after the state was requested, so a cached state from before the request
+    # cannot satisfy it.
     async def wait_until_correct_state(self, state):
-        while self.odrv.axis0.current_state != state:
+        loop = asyncio.get_running_loop()
+        since = loop.time()
+        deadline = since + STATE_TIMEOUT
+        started = since
+        while await self.transport.wait_for_poll(since, deadline - loop.time()):
+            if self.transport["current_state"] == state:
+                self.metrics.observe("state_wait", loop.time() - started)
+                return True
             await self.surface_errors()
-            continue
-
-    # Function to wait 1.05% of time we expect go for to take, and set the motor to IDLE
-    async def wait_and_set_to_idle(self, rps, revolutions):
-        time_sleep = abs(revolutions / rps) * 1.05
-        await asyncio.sleep(time_sleep)
-        if self.odrv.vbus_voltage < .15:
-            self.stop()
-        else:
-            LOGGER.warn(f"voltage ({self.odrv.vbus_voltage}) above expected value (.15) after waiting revolutions / rps * 1.05 = {time_sleep} seconds. Remaining in CLOSED_LOOP_CONTROL mode")
+            since = loop.time()
+        self.metrics.increment("state_wait_timeouts")
+        LOGGER.error("Unable to set to requested state, setting to idle")
+        await self.stop()
+        return False
+
+    # Function to wait until the trajectory is done or the motor has settled at the goal, and set the motor to IDLE
+    # As for the canbus model's MoveGoal, trajectory_done still reads as set from the previous move until the ODrive
+    # starts this one, so it only counts once a poll has seen it cleared.
+    async def wait_and_set_to_idle(self, goal_position, timeout):
+        loop = asyncio.get_running_loop()
+        since = loop.time()
+        deadline = since + timeout
+        trajectory_started = False
+        while await self.transport.wait_for_poll(since, deadline - loop.time()):
+            done = self.transport["trajectory_done"]
+            position = self.transport["position"]
+            velocity = self.transport["velocity"]
+            if not done:
+                trajectory_started = True
+            if (trajectory_started and done) or (abs(position - goal_position) < GOAL_POSITION_TOLERANCE and abs(velocity) < GOAL_VELOCITY_TOLERANCE):
+                await self.stop()
+                return
+            since = loop.time()
+        LOGGER.warning(f"goal position ({goal_position}) not reached after {timeout} seconds. Remaining in CLOSED_LOOP_CONTROL mode")
         
     async def surface_errors(self):
-        errorCode = self.odrv.axis0.active_errors
-        disarmReason = self.odrv.axis0.disarm_reason
+        errorCode = self.transport["active_errors"]
+        disarmReason = self.transport["disarm_reason"]
+        if errorCode is None:
+            return
         
         if  errorCode != 0:
             await self.stop()
@@ -170,4 +356,5 @@ class OdriveSerial(Motor, Reconfigurable):
             LOGGER.error(ODriveError(disarmReason).name)
         
         if errorCode != 0 or disarmReason != 0:
-            self.odrv.clear_errors()
+            self.metrics.increment("axis_errors")
+            await self.transport.call(self.odrv.clear_errors)
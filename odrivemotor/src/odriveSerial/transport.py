@@ -0,0 +1,104 @@
+"""
+Serial (USB fibre) transport for a single ODrive axis. Endpoint handles are resolved once, and the hot
+telemetry set is read in one background poll cycle off the event loop so getters are served from a cache.
+"""
+
+from typing import Any, Dict, Optional
+import asyncio
+import time
+
+from ..scheduler import run_blocking
+
+# cached value -> (endpoint handle attribute, property)
+TELEMETRY = {
+    "position": ("pos_vel_mapper", "pos_rel"),
+    "velocity": ("pos_vel_mapper", "vel"),
+    "current_state": ("axis", "current_state"),
+    "active_errors": ("axis", "active_errors"),
+    "disarm_reason": ("axis", "disarm_reason"),
+    "trajectory_done": ("controller", "trajectory_done"),
+    "iq_setpoint": ("foc", "Iq_setpoint"),
+    "vbus": ("odrv", "vbus_voltage"),
+}
+
+
+class SerialTransport:
+    odrv: Any
+    axis: Any
+    controller: Any
+    controller_config: Any
+    trap_traj_config: Any
+    pos_vel_mapper: Any
+    foc: Any
+    values: Dict[str, Any]
+    timestamp: Optional[float]
+
+    def __init__(self, odrv: Any):
+        self.odrv = odrv
+        self.axis = odrv.axis0
+        self.controller = self.axis.controller
+        self.controller_config = self.controller.config
+        self.trap_traj_config = self.axis.trap_traj.config
+        self.pos_vel_mapper = self.axis.pos_vel_mapper
+        self.foc = self.axis.motor.foc
+        self.values = {name: None for name in TELEMETRY}
+        self.timestamp = None
+        self._endpoints = [(name, getattr(self, handle), prop) for name, (handle, prop) in TELEMETRY.items()]
+        self._polled_at = None
+        self._requested_at = None
+        self._updated = asyncio.Event()
+        self.closed = False
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+    async def poll(self):
+        """Read the whole telemetry set in one executor call. Run periodically by the driver's scheduler."""
+        started_at = asyncio.get_running_loop().time()
+        self.values = await run_blocking(self._read_telemetry)
+        self.timestamp = time.time()
+        self._polled_at = started_at
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait_for_poll(self, since: float, timeout: Optional[float] = None) -> bool:
+        """Wait for a poll cycle that started after since (in event loop time), so its values reflect anything
+        written before then. Returns False on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._polled_at is None or self._polled_at < since:
+            if self.closed:
+                raise ConnectionError("the odrive was disconnected")
+            try:
+                await asyncio.wait_for(self._updated.wait(), None if deadline is None else deadline - loop.time())
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def age(self) -> Optional[float]:
+        """Seconds since the latest poll, or None when no poll has read the ODrive since a state was requested."""
+        if self.timestamp is None or (self._requested_at is not None and self._polled_at < self._requested_at):
+            return None
+        return time.time() - self.timestamp
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = dict(self.values)
+        snapshot["age"] = self.age()
+        return snapshot
+
+    async def write(self, handle: Any, prop: str, value: Any):
+        await run_blocking(setattr, handle, prop, value)
+        # the cached state no longer says whether the axis is powered, so reads wait for a poll that started after this
+        if prop == "requested_state":
+            self._requested_at = asyncio.get_running_loop().time()
+
+    def close(self):
+        """Wake anything waiting on a poll that will not come, after the ODrive stopped answering."""
+        self.closed = True
+        self._updated.set()
+
+    async def call(self, func, *args) -> Any:
+        return await run_blocking(func, *args)
+
+    def _read_telemetry(self) -> Dict[str, Any]:
+        return {name: getattr(handle, prop) for name, handle, prop in self._endpoints}
@@ -0,0 +1,26 @@
+"""
+Model registration that defers importing a model's implementation, and with it odrive, python-can and numpy,
+until the first component of that model is validated or created, so the module starts serving quickly and only
+loads the stacks its configured components use.
+"""
+
+from typing import Any, Mapping
+import importlib
+
+from viam.proto.app.robot import ComponentConfig
+from viam.resource.registry import Registry, ResourceCreatorRegistration
+from viam.resource.types import Model, Subtype
+
+
+def register_lazily(subtype: Subtype, model: Model, module: str, name: str):
+    """Register model with a creator and validator that import the class called name from module on first use."""
+    def load() -> Any:
+        return getattr(importlib.import_module(module), name)
+
+    def new(config: ComponentConfig, dependencies: Mapping):
+        return load().new(config, dependencies)
+
+    def validate(config: ComponentConfig):
+        return load().validate(config)
+
+    Registry.register_resource_creator(subtype, model, ResourceCreatorRegistration(new, validate))
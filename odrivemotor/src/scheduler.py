@@ -0,0 +1,52 @@
+"""
+Periodic jobs that run as tasks on the module's event loop, and a bounded executor for the blocking
+odrive/CAN calls they make.
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+
+from viam.logging import getLogger
+
+LOGGER = getLogger(__name__)
+EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="odrive-io")
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call on the shared executor so it does not stall the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+class PeriodicScheduler:
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, name: str, job: Callable[[], Awaitable[Any]], period: float):
+        """Run job every period seconds on the running loop, replacing any job already scheduled under name."""
+        self.cancel(name)
+        self._tasks[name] = asyncio.get_running_loop().create_task(self._run(name, job, period))
+
+    def cancel(self, name: str):
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        for name in list(self._tasks):
+            self.cancel(name)
+
+    async def _run(self, name: str, job: Callable[[], Awaitable[Any]], period: float):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while True:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(f"periodic job {name} failed: {e}")
+            # a job that overran its period runs again immediately rather than trying to catch up
+            next_run = max(next_run + period, loop.time())
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
@@ -1,5 +1,7 @@
-import odrive
 import json
+import hashlib
+import math
+import os
 from functools import reduce
 from collections.abc import MutableMapping
 
@@ -26,28 +28,80 @@ def rgetattr(obj, attr, *args):
         return getattr(obj, attr, *args)
     return reduce(_getattr, [obj] + attr.split('.'))
 
+# config files are parsed and flattened once, and only parsed again when their modification time or size changes
+# and their content hash differs.
+_loaded_configs = {}
+
+def load_config(config_path):
+    stat = os.stat(config_path)
+    cached = _loaded_configs.get(config_path)
+    if cached is not None and cached["stat"] == (stat.st_mtime_ns, stat.st_size):
+        return cached
+
+    with open(config_path, "rb") as json_file:
+        content = json_file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if cached is None or cached["hash"] != digest:
+        cached = {"hash": digest, "flat": flatten(json.loads(content))}
+    cached["stat"] = (stat.st_mtime_ns, stat.st_size)
+    _loaded_configs[config_path] = cached
+    return cached
+
+def values_equal(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        try:
+            a, b = float(a), float(b)
+        except (TypeError, ValueError):
+            return False
+        return (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-6)
+    return a == b
+
+# Writes only the keys whose values differ from the ODrive's, grouping them by parent object so each parent is
+# resolved once. Every value is read back from the device first: writes only live in the ODrive's RAM, so a power
+# cycle or a change made with odrivetool can undo any of them. Returns the number of values written.
 def set_configs(odrv, config_path):
-    with open(config_path) as json_file:
-        configs = json.load(json_file)
+    config = load_config(config_path)
+    groups = {}
+    for k, v in config["flat"].items():
+        # backups contain null for values the firmware could not read, which cannot be written back
+        if v is None:
+            continue
+        pre, _, post = k.rpartition('.')
+        groups.setdefault(pre, []).append((post, v))
 
-    for k,v in flatten(configs).items():
-        rsetattr(odrv, k, v)
+    writes = 0
+    for pre, values in groups.items():
+        parent = rgetattr(odrv, pre) if pre else odrv
+        for post, v in values:
+            if not values_equal(getattr(parent, post), v):
+                setattr(parent, post, v)
+                writes += 1
+    return writes
 
 def find_baudrate(config_path):
-    with open(config_path) as json_file:
-        configs = json.load(json_file)
+    configs = load_config(config_path)["flat"]
 
-    if configs["can"]["config"]["baud_rate"]:
-        return configs["can"]["config"]["baud_rate"]
+    if configs.get("can.config.baud_rate"):
+        return configs["can.config.baud_rate"]
     else:
         return 250000
     
+# accepts a bit rate as written in configs and by `ip link`: 250000, 250k, 250kbps, 1M. Raises ValueError.
+def parse_baud_rate(baud_rate):
+    value = baud_rate.strip().lower()
+    if value.endswith("bps"):
+        value = value[:-3]
+    multiplier = 1
+    if value.endswith("k"):
+        multiplier, value = 1000, value[:-1]
+    elif value.endswith("m"):
+        multiplier, value = 1000000, value[:-1]
+    rate = float(value) * multiplier
+    if not rate.is_integer() or rate <= 0:
+        raise ValueError(f"'{baud_rate}' is not a bit rate")
+    return int(rate)
+
 def find_axis_configs(config_path, config_params):
-    with open(config_path) as json_file:
-        configs = json.load(json_file)
-    
-    value = configs["axis0"]["config"]
-    for i in range(len(config_params)):
-        value = value[config_params[i]]
+    configs = load_config(config_path)["flat"]
 
-    return value
+    return configs[".".join(["axis0", "config"] + config_params)]
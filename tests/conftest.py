@@ -0,0 +1,53 @@
+"""
+Fixtures for the tests. The canbus models run against benchmarks.simulator on python-can's in-process virtual
+interface, each test on its own channel so that dispatchers and simulated nodes never leak between tests. The serial
+model runs against a benchmarks.fake_fibre device with a serial number of its own.
+"""
+
+import itertools
+
+import pytest
+
+from benchmarks import fake_fibre
+
+from .support import component_config
+
+_channels = itertools.count()
+_serial_numbers = itertools.count(0x3867326F0000)
+
+
+@pytest.fixture
+def channel() -> str:
+    return f"test-{next(_channels)}"
+
+
+@pytest.fixture
+def motor_config(channel):
+    """Config for a canbus motor on the test's channel; attributes are added to or override the defaults."""
+    def config(node_id: int = 1, **attributes):
+        return component_config("motor", {"canbus_channel": channel, "canbus_interface": "virtual",
+                                          "canbus_node_id": node_id, "metrics": True, **attributes})
+    return config
+
+
+@pytest.fixture
+def group_config(channel):
+    def config(node_ids):
+        return component_config("group", {"canbus_channel": channel, "canbus_interface": "virtual", "canbus_node_ids": node_ids})
+    return config
+
+
+@pytest.fixture
+def serial_device():
+    """A fake ODrive the serial model's discovery can find, without USB latency."""
+    device = fake_fibre.FakeODrive(next(_serial_numbers), latency=0.0)
+    fake_fibre.install([device])
+    yield device
+    fake_fibre.uninstall([device])
+
+
+@pytest.fixture
+def serial_config(serial_device):
+    def config(**attributes):
+        return component_config("motor", {"serial_number": serial_device._serial_number, "metrics": True, **attributes})
+    return config
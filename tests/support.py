@@ -0,0 +1,26 @@
+"""
+Helpers for the tests that drive the models against simulated ODrives.
+"""
+
+from typing import Any, Callable, Dict
+import asyncio
+
+from google.protobuf.struct_pb2 import Struct
+from viam.proto.app.robot import ComponentConfig
+
+
+def component_config(name: str, attributes: Dict[str, Any]) -> ComponentConfig:
+    struct = Struct()
+    struct.update(attributes)
+    return ComponentConfig(name=name, attributes=struct)
+
+
+async def eventually(condition: Callable[[], bool], timeout: float = 2.0) -> bool:
+    """Poll condition until it holds, for frames the simulator thread sends or answers."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
@@ -0,0 +1,71 @@
+import pytest
+
+from odrivemotor.src.odriveCAN import bandwidth
+from odrivemotor.src.odriveCAN.bandwidth import CYCLIC_MESSAGES, FRAME_BITS, MAX_PERIODS, fit, load, read_periods
+
+
+def test_frame_bits():
+    # 8 data bytes: 111 bits before stuffing, plus at most 24 stuff bits
+    assert FRAME_BITS == 135
+    assert bandwidth.frame_bits(0) == 55
+
+
+def test_read_periods():
+    config = {"axis0.config.can.heartbeat_msg_rate_ms": 100, "axis0.config.can.encoder_msg_rate_ms": None,
+              "axis0.config.can.iq_msg_rate_ms": 10}
+    assert read_periods(config) == {"heartbeat": 100, "encoder": 0, "iq": 10}
+
+
+def test_load():
+    assert load({"heartbeat": 100, "encoder": 10, "iq": 0}) == pytest.approx(FRAME_BITS * 110)
+
+
+def test_fit_leaves_a_bus_under_budget_alone():
+    periods = {1: {"heartbeat": 100, "encoder": 10}}
+    assert fit(periods, load(periods[1]) * 2) == periods
+
+
+def test_fit_turns_off_low_priority_messages_first():
+    periods = {node: {"heartbeat": 100, "encoder": 10, "iq": 10, "temperature": 10} for node in (1, 2)}
+    proposed = fit(periods, 2 * load({"heartbeat": 100, "encoder": 10, "iq": 10}))
+    assert all(node["temperature"] == 0 for node in proposed.values())
+    assert all(node["iq"] == 10 and node["encoder"] == 10 for node in proposed.values())
+    # the input is not modified
+    assert periods[1]["temperature"] == 10
+
+
+def test_fit_stretches_a_message_that_can_cover_the_excess():
+    periods = {1: {"heartbeat": 100, "encoder": 10, "iq": 10}}
+    budget = load(periods[1]) - FRAME_BITS * 50
+    proposed = fit(periods, budget)
+    assert 10 < proposed[1]["iq"]
+    assert proposed[1]["encoder"] == 10
+    assert sum(load(node) for node in proposed.values()) <= budget
+
+
+def test_fit_never_turns_off_or_exceeds_the_maximum_period_of_essential_messages():
+    periods = {node: {"heartbeat": 10, "encoder": 1, "iq": 1} for node in range(8)}
+    proposed = fit(periods, 1.0)
+    for node in proposed.values():
+        assert node["iq"] == 0
+        for message, maximum in MAX_PERIODS.items():
+            assert 0 < node[message] <= maximum
+
+
+def test_priority_order():
+    assert CYCLIC_MESSAGES[:2] == ["heartbeat", "encoder"]
+
+
+def test_plan_and_apply(tmp_path):
+    config_path = tmp_path / "odrive.json"
+    config_path.write_text('{\n  "axis0.config.can.iq_msg_rate_ms": 1\n}\n')
+    bandwidth.register_node("plan-test", 1, {"heartbeat": 100, "encoder": 10, "iq": 1}, str(config_path))
+    try:
+        plan = bandwidth.plan("plan-test", 250000, 0.5)
+        assert plan["oversubscribed"]
+        assert plan["proposed_utilization"] <= 0.5
+        assert bandwidth.apply_plan("plan-test", plan["proposed"]) == [str(config_path)]
+        assert f'"axis0.config.can.iq_msg_rate_ms": {plan["proposed"]["1"]["iq"]}' in config_path.read_text()
+        assert not bandwidth.plan("plan-test", 250000, 0.5)["oversubscribed"]
+    finally:
+        bandwidth.unregister_node("plan-test", 1)
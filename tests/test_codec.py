@@ -0,0 +1,61 @@
+import os
+
+import cantools
+import pytest
+
+from odrivemotor.src.odriveCAN import codec
+from odrivemotor.src.odriveCAN.codec import DBC_PATH, NODE_ID_SHIFT, load_codec
+
+DATABASE = cantools.database.load_file(DBC_PATH)
+
+
+def sample_value(signal):
+    """A value every signal can hold exactly, so that both codecs produce the same bytes."""
+    if signal.is_float:
+        return 1.5
+    raw = -3 if signal.is_signed else 3
+    return raw * signal.scale + signal.offset
+
+
+@pytest.mark.parametrize("message", DATABASE.messages, ids=lambda message: message.name)
+def test_matches_cantools(message):
+    codec = load_codec()[message.name]
+    data = {signal.name: sample_value(signal) for signal in message.signals}
+    payload = codec.encode(data)
+    assert payload == message.encode(data, padding=False)
+    decoded = codec.decode(payload)
+    for name, value in message.decode(payload).items():
+        assert decoded[name] == pytest.approx(value)
+
+
+def test_covers_every_message():
+    assert set(load_codec().messages) == {message.name for message in DATABASE.messages}
+    assert {message.frame_id for message in DATABASE.messages} == set(load_codec().by_cmd_id)
+
+
+def test_arbitration_ids():
+    ids = load_codec().arbitration_ids(3)
+    assert ids['Heartbeat'] == (3 << NODE_ID_SHIFT) | load_codec()['Heartbeat'].cmd_id
+
+
+def test_cache_path_is_versioned(monkeypatch, tmp_path):
+    monkeypatch.setenv("VIAM_MODULE_DATA", str(tmp_path))
+    path = codec.compiled_cache_path(b"dbc")
+    monkeypatch.setattr(codec, "COMPILED_FORMAT_VERSION", codec.COMPILED_FORMAT_VERSION + 1)
+    assert codec.compiled_cache_path(b"dbc") != path
+    assert os.path.dirname(path) == str(tmp_path)
+
+
+def test_cache_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setenv("VIAM_MODULE_DATA", str(tmp_path))
+    load_codec.cache_clear()
+    try:
+        compiled = load_codec()
+        assert os.listdir(tmp_path) == [os.path.basename(codec.compiled_cache_path(open(DBC_PATH, "rb").read()))]
+        load_codec.cache_clear()
+        monkeypatch.setattr(codec, "compile_dbc", lambda path: pytest.fail("the cached codec was compiled again"))
+        cached = load_codec()
+    finally:
+        load_codec.cache_clear()
+    payload = compiled['Set_Input_Pos'].encode({'Input_Pos': 1.25, 'Vel_FF': 0.5, 'Torque_FF': -0.25})
+    assert cached['Set_Input_Pos'].decode(payload) == compiled['Set_Input_Pos'].decode(payload)
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks import fake_fibre
+from odrivemotor.src.discovery import connect_odrive, find_odrive, normalize_serial_number
+
+
+@pytest.fixture
+def devices():
+    devices = [fake_fibre.FakeODrive(serial_number, latency=0.0) for serial_number in (0x3867326F1001, 0x3867326F1002)]
+    fake_fibre.install(devices)
+    yield devices
+    fake_fibre.uninstall(devices)
+
+
+@pytest.mark.parametrize("serial_number", ["3867326F1002", "0x3867326f1002", " 003867326F1002 "])
+def test_serial_numbers_match_in_any_format(serial_number):
+    assert normalize_serial_number(serial_number) == "3867326F1002"
+
+
+def test_find_odrive_by_serial_number(devices):
+    async def scenario():
+        assert await find_odrive("0x3867326f1002", timeout=0.1) is devices[1]
+        assert await find_odrive("", timeout=0.1) in devices
+        with pytest.raises(TimeoutError):
+            await find_odrive("3867326F1003", timeout=0.1)
+    asyncio.run(scenario())
+
+
+def test_find_odrive_waits_for_a_device_to_be_connected(devices):
+    async def scenario():
+        late = fake_fibre.FakeODrive(0x3867326F1003, latency=0.0)
+        search = asyncio.create_task(find_odrive("3867326F1003", timeout=2.0))
+        await asyncio.sleep(0.1)
+        assert not search.done()
+        fake_fibre.install([late])
+        try:
+            assert await search is late
+        finally:
+            fake_fibre.uninstall([late])
+    asyncio.run(scenario())
+
+
+def test_odrives_are_configured_concurrently(devices):
+    def configure(odrv):
+        time.sleep(0.3)
+        return odrv.serial_number
+
+    async def scenario():
+        started = time.monotonic()
+        results = await asyncio.gather(*(connect_odrive(device._serial_number, configure, timeout=2.0) for device in devices))
+        assert time.monotonic() - started < 0.55
+        assert results == [(device, device.serial_number) for device in devices]
+        with pytest.raises(TimeoutError):
+            await connect_odrive(devices[0]._serial_number, configure, timeout=0.1)
+    asyncio.run(scenario())
@@ -0,0 +1,130 @@
+import asyncio
+
+import can
+
+from benchmarks.simulator import CANSimpleSimulator
+from odrivemotor.src.odriveCAN.dispatcher import MATCH_NOTHING_FILTERS, get_dispatcher, release_dispatcher
+from odrivemotor.src.odriveCAN.telemetry import AxisTelemetry, ENCODER_ESTIMATES, HEARTBEAT
+
+from .support import eventually
+
+
+def test_reader_survives_a_raising_subscriber(channel):
+    async def scenario():
+        with CANSimpleSimulator([1, 2], channel, "virtual"):
+            dispatcher = get_dispatcher(channel, "virtual")
+            dispatcher.metrics.enabled = True
+            cmd_id = dispatcher.codec[ENCODER_ESTIMATES].cmd_id
+            received = []
+
+            def broken(decoded, timestamp):
+                raise RuntimeError("subscriber bug")
+
+            dispatcher.subscribe(1, cmd_id, broken)
+            dispatcher.subscribe(1, cmd_id, lambda decoded, timestamp: received.append(1))
+            dispatcher.subscribe(2, cmd_id, lambda decoded, timestamp: received.append(2))
+            try:
+                # both nodes keep being served, including the other subscriber of the failing node
+                assert await eventually(lambda: received.count(1) > 5 and received.count(2) > 5)
+                assert dispatcher.metrics.counters["reader_errors"] > 5
+            finally:
+                release_dispatcher(dispatcher).result()
+    asyncio.run(scenario())
+
+
+def test_dispatcher_is_shared_and_closed_by_the_last_release(channel):
+    first = get_dispatcher(channel, "virtual")
+    second = get_dispatcher(channel, "virtual")
+    assert first is second
+    assert release_dispatcher(first) is None
+    release_dispatcher(second).result()
+    third = get_dispatcher(channel, "virtual")
+    assert third is not first
+    release_dispatcher(third).result()
+
+
+def test_reader_is_restarted_after_an_interface_error(channel):
+    async def scenario():
+        with CANSimpleSimulator([1], channel, "virtual"):
+            dispatcher = get_dispatcher(channel, "virtual")
+            dispatcher.metrics.enabled = True
+            received = []
+            dispatcher.subscribe(1, dispatcher.codec[ENCODER_ESTIMATES].cmd_id, lambda decoded, timestamp: received.append(1))
+            try:
+                assert await eventually(lambda: len(received) > 0)
+
+                def unplugged(timeout=None):
+                    raise can.CanOperationError("interface went down")
+                dispatcher.bus.recv = unplugged
+                assert await eventually(lambda: dispatcher.metrics.counters.get("reader_errors") == 1)
+                # the reopened interface keeps the subscriptions
+                assert await eventually(lambda: dispatcher.metrics.counters.get("reader_restarts") == 1)
+                count = len(received)
+                assert await eventually(lambda: len(received) > count + 5)
+            finally:
+                release_dispatcher(dispatcher).result()
+    asyncio.run(scenario())
+
+
+def test_frames_are_stamped_with_the_host_clock(channel):
+    dispatcher = get_dispatcher(channel, "virtual")
+    telemetry = AxisTelemetry()
+    telemetry.attach(dispatcher, 1)
+    heartbeat = dispatcher.codec[HEARTBEAT]
+    payload = heartbeat.encode({'Axis_Error': 0, 'Axis_State': 8, 'Motor_Flags': 0, 'Encoder_Flags': 0, 'Controller_Flags': 0})
+    try:
+        # interfaces that stamp frames with the time since boot, or leave them unstamped
+        for timestamp in (12.5, 0.0):
+            dispatcher.on_message_received(can.Message(arbitration_id=(1 << 5) | heartbeat.cmd_id, is_extended_id=False,
+                                                       data=payload, timestamp=timestamp))
+            assert 0 <= telemetry.age(HEARTBEAT) < 1.0
+            assert not telemetry.is_stale(HEARTBEAT, 1.0)
+    finally:
+        telemetry.detach()
+        release_dispatcher(dispatcher).result()
+
+
+def filtered_ids(dispatcher):
+    return {f["can_id"] for f in dispatcher.bus.filters}
+
+
+def test_frames_nobody_subscribed_to_are_filtered_out(channel):
+    async def scenario():
+        with CANSimpleSimulator([1, 2], channel, "virtual", heartbeat_rate=100):
+            dispatcher = get_dispatcher(channel, "virtual")
+            dispatcher.metrics.enabled = True
+            received = []
+            dispatcher.subscribe(1, dispatcher.codec[ENCODER_ESTIMATES].cmd_id, lambda decoded, timestamp: received.append(1))
+            try:
+                assert await eventually(lambda: len(received) > 20)
+                # node 2, and node 1's heartbeats, never reach the reader
+                assert dispatcher.metrics.counters.get("rx_unsubscribed", 0) == 0
+                assert dispatcher.metrics.counters["rx_frames"] == len(received)
+            finally:
+                release_dispatcher(dispatcher).result()
+    asyncio.run(scenario())
+
+
+def test_filters_follow_the_subscriptions(channel):
+    dispatcher = get_dispatcher(channel, "virtual")
+    heartbeat = dispatcher.codec[HEARTBEAT].cmd_id
+    try:
+        assert dispatcher.bus.filters == MATCH_NOTHING_FILTERS
+        callback = lambda decoded, timestamp: None
+        dispatcher.subscribe(2, heartbeat, callback)
+        assert filtered_ids(dispatcher) == {(2 << 5) | heartbeat}
+
+        # renumbering a node moves every one of its filters
+        telemetry = AxisTelemetry()
+        telemetry.attach(dispatcher, 1)
+        assert {can_id >> 5 for can_id in filtered_ids(dispatcher)} == {1, 2}
+        telemetry.attach(dispatcher, 7)
+        assert {can_id >> 5 for can_id in filtered_ids(dispatcher)} == {2, 7}
+        assert (7 << 5) | heartbeat in filtered_ids(dispatcher)
+
+        telemetry.detach()
+        assert filtered_ids(dispatcher) == {(2 << 5) | heartbeat}
+        dispatcher.unsubscribe(2, heartbeat, callback)
+        assert dispatcher.bus.filters == MATCH_NOTHING_FILTERS
+    finally:
+        release_dispatcher(dispatcher).result()
@@ -0,0 +1,296 @@
+import asyncio
+
+import pytest
+
+from benchmarks.simulator import CANSimpleSimulator, CLOSED_LOOP_CONTROL, IDLE, POSITION_CONTROL, VELOCITY_CONTROL
+from odrivemotor.src.odriveCAN.dispatcher import get_dispatcher, release_dispatcher
+from odrivemotor.src.odriveCAN.odriveCAN import OdriveCAN
+from odrivemotor.src.odriveCAN.telemetry import ENCODER_ESTIMATES
+from odrivemotor.src.odriveCANGroup.odriveCANGroup import OdriveCANGroup
+
+from .support import eventually
+
+MISSING_INPUT = 0x40
+
+
+def run(channel, scenario, node_ids=(1,), **simulator_options):
+    """Run scenario(simulator) against simulated nodes on the test's channel."""
+    async def main():
+        with CANSimpleSimulator(node_ids, channel, "virtual", **simulator_options) as simulator:
+            await scenario(simulator)
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("policy, state, cleared", [("idle", IDLE, True), ("estop", IDLE, False), ("hold", CLOSED_LOOP_CONTROL, False)])
+def test_fault_reaction(channel, motor_config, policy, state, cleared):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(fault_policy=policy), {})
+        axis = simulator.axes[1]
+        try:
+            await motor.set_rpm(60)
+            assert axis.axis_state == CLOSED_LOOP_CONTROL
+            # an error the firmware reports without idling the axis, so that only the module's reaction changes it
+            axis.axis_error |= MISSING_INPUT
+            assert await eventually(lambda: len(motor.faults.history) == 1)
+            fault = motor.faults.history[0]
+            assert fault["policy"] == policy
+            assert fault["axis_error"] & MISSING_INPUT
+            assert await eventually(lambda: fault.get("name") is not None)
+            assert "MISSING_INPUT" in fault["name"]
+            assert await eventually(lambda: axis.axis_state == state)
+            assert await eventually(lambda: (axis.axis_error == 0) == cleared)
+            assert motor.metrics.counters["axis_errors"] == 1
+        finally:
+            await motor.close()
+    run(channel, scenario, heartbeat_rate=100)
+
+
+def test_fault_is_only_reported_once_until_cleared(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(fault_policy="hold"), {})
+        try:
+            simulator.axes[1].axis_error = MISSING_INPUT
+            assert await eventually(lambda: motor.faults.faulted)
+            await asyncio.sleep(0.1)
+            assert len(motor.faults.history) == 1
+            await motor.do_command({"clear_faults": True})
+            assert await eventually(lambda: not motor.faults.faulted)
+            simulator.axes[1].axis_error = MISSING_INPUT
+            assert await eventually(lambda: len(motor.faults.history) == 2)
+        finally:
+            await motor.close()
+    run(channel, scenario, heartbeat_rate=100)
+
+
+def test_node_renumbering(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(node_id=1), {})
+        try:
+            await motor.set_rpm(60)
+            motor.reconfigure(motor_config(node_id=7), {})
+            assert await eventually(lambda: 7 in simulator.axes and 1 not in simulator.axes)
+            assert motor.nodeID == 7
+            # telemetry follows the node to its new id
+            assert await eventually(lambda: motor.telemetry.age("Heartbeat") is not None and motor.telemetry.age("Heartbeat") < 0.2)
+            await motor.set_rpm(120)
+            assert await eventually(lambda: simulator.axes[7].input_vel == pytest.approx(2.0))
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_shadow_skips_unchanged_controller_configuration(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        try:
+            await motor.set_rpm(60)
+            await motor.set_rpm(120)
+            assert motor.metrics.counters["shadow_skipped"] == 1
+            assert await eventually(lambda: simulator.axes[1].input_vel == pytest.approx(2.0))
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_group_command_invalidates_the_shadow(channel, motor_config, group_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        group = OdriveCANGroup.new(group_config([1]), {})
+        axis = simulator.axes[1]
+        try:
+            await motor.set_rpm(60)
+            await group.go_for([60], [100], False)
+            assert axis.control_mode == POSITION_CONTROL
+            await motor.set_rpm(120)
+            assert await eventually(lambda: axis.input_vel == pytest.approx(2.0))
+            assert axis.control_mode == VELOCITY_CONTROL
+        finally:
+            await group.close()
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_record_capacity_is_validated(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        try:
+            for capacity in (0, -1, 2.5, "8"):
+                with pytest.raises(ValueError):
+                    await motor.do_command({"record": {"capacity": capacity}})
+            assert motor.recorder is None
+            await motor.do_command({"record": {"capacity": 4.0}})
+            assert await eventually(lambda: motor.recorder.rings["Get_Encoder_Estimates"].count > 4)
+            assert len(motor.check_recorder().rings["Get_Encoder_Estimates"].window()["timestamp"]) == 4
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_stream_timeout_holds_the_motor(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        axis = simulator.axes[1]
+        try:
+            await motor.do_command({"stream": {"mode": "velocity", "timeout_s": 0.2}})
+            await motor.do_command({"setpoint": 60})
+            assert await eventually(lambda: axis.input_vel == pytest.approx(1.0))
+            assert await eventually(lambda: axis.input_vel == 0.0, timeout=1.0)
+            assert motor.metrics.counters["stream_timeouts"] == 1
+            await motor.do_command({"setpoint": 30})
+            assert await eventually(lambda: axis.input_vel == pytest.approx(0.5))
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_missing_heartbeat_is_reported_after_a_grace_period(channel, motor_config):
+    async def scenario(simulator):
+        present = OdriveCAN.new(motor_config(node_id=1, error_check_period=0.2), {})
+        missing = OdriveCAN.new(motor_config(node_id=5, error_check_period=0.2), {})
+        try:
+            await asyncio.sleep(0.1)
+            assert not missing.heartbeat_lost
+            assert await eventually(lambda: missing.heartbeat_lost)
+            assert not present.heartbeat_lost
+        finally:
+            await present.close()
+            await missing.close()
+    run(channel, scenario)
+
+
+def test_group_abandons_a_move_when_an_axis_cannot_be_enabled(channel, group_config, monkeypatch):
+    monkeypatch.setattr("odrivemotor.src.odriveCANGroup.odriveCANGroup.STATE_TIMEOUT", 0.3)
+
+    async def scenario(simulator):
+        group = OdriveCANGroup.new(group_config([1, 2]), {})
+        try:
+            with pytest.raises(ValueError):
+                await group.go_for([60, 0], [1, 1], True)
+            simulator.axes[2].fault(MISSING_INPUT)
+            with pytest.raises(TimeoutError):
+                await group.set_rpm([60, 60])
+            assert simulator.axes[1].input_vel == 0.0
+            assert await eventually(lambda: simulator.axes[1].axis_state == IDLE)
+        finally:
+            await group.close()
+    run(channel, scenario, node_ids=(1, 2))
+
+
+@pytest.mark.parametrize("rate", [0, -10])
+def test_trajectory_rate_is_checked_before_the_axis_is_commanded(channel, motor_config, rate):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        axis = simulator.axes[1]
+        try:
+            await motor.set_rpm(60)
+            await motor.stop()
+            with pytest.raises(ValueError):
+                await motor.do_command({"trajectory": {"waypoints": [10], "rpm": 60, "rpm_per_sec": 60, "rate_hz": rate}})
+            await asyncio.sleep(0.1)
+            assert axis.control_mode == VELOCITY_CONTROL
+            assert axis.axis_state == IDLE
+            assert motor.stream is None
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_cancelling_a_trajectory_wait_cancels_the_caller(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        try:
+            command = asyncio.create_task(motor.do_command(
+                {"trajectory": {"waypoints": [5], "rpm": 60, "rpm_per_sec": 60, "wait": True}}))
+            assert await eventually(lambda: motor.stream is not None)
+            command.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await command
+            # stopping the stream instead ends the wait early
+            result = asyncio.create_task(motor.do_command(
+                {"trajectory": {"waypoints": [-5], "rpm": 60, "rpm_per_sec": 60, "wait": True}}))
+            assert await eventually(lambda: motor.stream is not None and motor.stream.profile.position[-1] == -5)
+            motor.stop_stream()
+            assert (await result)["trajectory"]["completed"] is False
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+@pytest.mark.parametrize("options", [{"rate_hz": 0}, {"rate_hz": -1}, {"timeout_s": -1}, {"mode": "current"}])
+def test_stream_options_are_checked_before_the_axis_is_commanded(channel, motor_config, options):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        axis = simulator.axes[1]
+        try:
+            await motor.go_for(60, 0.1)
+            await motor.stop()
+            with pytest.raises(ValueError):
+                await motor.do_command({"stream": {"mode": "velocity", **options}})
+            await asyncio.sleep(0.1)
+            assert axis.control_mode == POSITION_CONTROL
+            assert axis.axis_state == IDLE
+            assert motor.stream is None
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+@pytest.mark.parametrize("baud_rate, expected", [("1M", 1000000), ("250kbps", 250000), ("500K", 500000), ("125000", 125000), ("fast", 250000)])
+def test_baud_rate_attribute(channel, motor_config, baud_rate, expected):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(canbus_baud_rate=baud_rate), {})
+        try:
+            assert motor.baud_rate == expected
+        finally:
+            await motor.close()
+    run(channel, scenario)
+
+
+def test_a_failed_new_releases_the_interface(channel, motor_config, group_config):
+    async def scenario():
+        with pytest.raises(OSError):
+            OdriveCAN.new(motor_config(odrive_config_file="/nonexistent/odrive-config.json"), {})
+        with pytest.raises(ValueError):
+            OdriveCANGroup.new(group_config([1, float("nan")]), {})
+        dispatcher = get_dispatcher(channel, "virtual")
+        try:
+            # a new dispatcher, since the failed components released theirs
+            assert dispatcher.references == 1
+            assert not dispatcher._subscribers
+        finally:
+            release_dispatcher(dispatcher).result()
+    asyncio.run(scenario())
+
+
+def test_messages_that_are_not_broadcast_are_requested(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(), {})
+        simulator.axes[1].position = 3.0
+        try:
+            assert await motor.get_position() == 3.0
+            assert motor.metrics.counters["requests.Get_Encoder_Estimates"] == 1
+            # served from the reply until a caller bounds its age
+            simulator.axes[1].position = 5.0
+            assert await motor.get_position() == 3.0
+            await asyncio.sleep(0.05)
+            assert await motor.get_position({"max_age": 0.01}) == 5.0
+            assert motor.metrics.counters["requests.Get_Encoder_Estimates"] == 2
+            # a node that does not answer times out instead of hanging
+            assert await motor.dispatcher.request(9, motor.codec[ENCODER_ESTIMATES].cmd_id, 0.1) is None
+        finally:
+            await motor.close()
+    run(channel, scenario, encoder_rate=0)
+
+
+def test_telemetry_max_age_applies_to_every_call(channel, motor_config):
+    async def scenario(simulator):
+        motor = OdriveCAN.new(motor_config(telemetry_max_age=0.01), {})
+        try:
+            await motor.get_position()
+            simulator.axes[1].position = 2.0
+            await asyncio.sleep(0.05)
+            assert await motor.get_position() == 2.0
+            assert motor.metrics.counters["telemetry_stale.Get_Encoder_Estimates"] == 1
+        finally:
+            await motor.close()
+    run(channel, scenario, encoder_rate=0)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+import pytest
+
+from benchmarks.simulator import CLOSED_LOOP_CONTROL, IDLE
+from odrivemotor.src.odriveSerial.odriveSerial import MAX_POLL_FAILURES, OdriveSerial
+
+from .support import eventually
+
+
+def run(scenario):
+    asyncio.run(scenario())
+
+
+def test_getters_are_served_from_the_poll_cache(serial_config, serial_device):
+    async def scenario():
+        motor = OdriveSerial.new(serial_config(), {})
+        try:
+            serial_device.axis.position = 2.5
+            assert await motor.get_position() == 2.5
+            motor.scheduler.cancel("poll_telemetry")
+            transfers = serial_device.transfers
+            serial_device.axis.position = 4.0
+            for _ in range(10):
+                assert await motor.get_position() == 2.5
+                assert (await motor.is_powered())[0] is False
+                assert await motor.is_moving() is False
+            assert serial_device.transfers == transfers
+        finally:
+            await motor.close()
+    run(scenario)
+
+
+def test_is_powered_after_stop_waits_for_a_fresh_poll(serial_config, serial_device):
+    async def scenario():
+        # a poll period long enough that the cache still holds the closed loop state when stop() returns
+        motor = OdriveSerial.new(serial_config(telemetry_poll_period=0.5), {})
+        try:
+            await motor.set_rpm(60)
+            assert (await motor.is_powered())[0] is True
+            await motor.stop()
+            assert (await motor.is_powered())[0] is False
+        finally:
+            await motor.close()
+    run(scenario)
+
+
+def test_wait_until_correct_state_ignores_a_state_read_before_the_request(serial_config, serial_device, monkeypatch):
+    monkeypatch.setattr("odrivemotor.src.odriveSerial.odriveSerial.STATE_TIMEOUT", 0.3)
+
+    async def scenario():
+        motor = OdriveSerial.new(serial_config(), {})
+        axis = serial_device.axis
+        try:
+            await motor.set_rpm(60)
+            assert await eventually(lambda: motor.transport["current_state"] == CLOSED_LOOP_CONTROL)
+            motor.scheduler.cancel("poll_telemetry")
+            # the axis drops out of closed loop control while the cache still says it is in it
+            axis.request_state(IDLE)
+            motor.scheduler.schedule("poll_telemetry", motor.poll_telemetry, motor.telemetry_poll_period)
+            assert await motor.wait_until_correct_state(CLOSED_LOOP_CONTROL) is False
+            assert motor.metrics.counters["state_wait_timeouts"] == 1
+        finally:
+            await motor.close()
+    run(scenario)
+
+
+def test_an_odrive_that_stops_answering_is_reconnected(serial_config, serial_device, caplog):
+    async def scenario():
+        motor = OdriveSerial.new(serial_config(connect_timeout=0.5), {})
+        try:
+            await motor.get_position()
+            transfer = serial_device._transfer
+
+            def unplugged():
+                raise OSError("USB transfer failed")
+            object.__setattr__(serial_device, "_transfer", unplugged)
+            assert await eventually(lambda: motor.transport is None)
+            assert motor.metrics.counters["poll_errors"] == MAX_POLL_FAILURES
+            # getters fail rather than reading the last values polled
+            with pytest.raises(ConnectionError):
+                await motor.get_position()
+            object.__setattr__(serial_device, "_transfer", transfer)
+            serial_device.axis.position = 1.5
+            assert await motor.get_position() == 1.5
+        finally:
+            await motor.close()
+    with caplog.at_level(logging.WARNING):
+        run(scenario)
+    assert sum("telemetry poll of" in record.getMessage() for record in caplog.records) == 1
+    assert sum("reconnecting" in record.getMessage() for record in caplog.records) == 1
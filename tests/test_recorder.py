@@ -0,0 +1,43 @@
+import numpy as np
+
+from odrivemotor.src.odriveCAN.recorder import MessageRing
+
+SIGNALS = [('Pos_Estimate', 'f4'), ('Axis_State', 'u1')]
+
+
+def fill(ring, start, stop):
+    for i in range(start, stop):
+        ring.append({'Pos_Estimate': i, 'Axis_State': i % 256}, float(i))
+
+
+def test_window_before_wrapping():
+    ring = MessageRing(SIGNALS, 8)
+    fill(ring, 0, 5)
+    window = ring.window()
+    assert list(window['timestamp']) == [0, 1, 2, 3, 4]
+    assert list(ring.window(2)['Pos_Estimate']) == [3, 4]
+    assert window['Axis_State'].dtype == np.uint8
+
+
+def test_window_after_wrapping_is_oldest_first():
+    ring = MessageRing(SIGNALS, 8)
+    fill(ring, 0, 21)
+    assert ring.count == 21
+    assert list(ring.window()['timestamp']) == list(range(13, 21))
+    assert list(ring.window(3)['Pos_Estimate']) == [18, 19, 20]
+    # asking for more than the ring holds returns what it holds
+    assert len(ring.window(100)['timestamp']) == 8
+
+
+def test_empty_window():
+    ring = MessageRing(SIGNALS, 4)
+    assert len(ring.window()['timestamp']) == 0
+    assert len(ring.window(2)['Pos_Estimate']) == 0
+
+
+def test_window_is_a_copy():
+    ring = MessageRing(SIGNALS, 4)
+    fill(ring, 0, 4)
+    window = ring.window()
+    fill(ring, 4, 8)
+    assert list(window['timestamp']) == [0, 1, 2, 3]
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+from odrivemotor.src.scheduler import PeriodicScheduler, run_blocking
+
+from .support import eventually
+
+
+def test_jobs_run_periodically_until_cancelled():
+    async def scenario():
+        scheduler = PeriodicScheduler()
+        runs = []
+
+        async def job():
+            runs.append(1)
+        scheduler.schedule("job", job, 0.01)
+        assert await eventually(lambda: len(runs) >= 5)
+        scheduler.cancel_all()
+        await asyncio.sleep(0.05)
+        count = len(runs)
+        await asyncio.sleep(0.05)
+        assert len(runs) == count
+    asyncio.run(scenario())
+
+
+def test_a_failing_job_keeps_running():
+    async def scenario():
+        scheduler = PeriodicScheduler()
+        runs = []
+
+        async def job():
+            runs.append(1)
+            raise RuntimeError("job bug")
+        scheduler.schedule("job", job, 0.01)
+        try:
+            assert await eventually(lambda: len(runs) >= 3)
+        finally:
+            scheduler.cancel_all()
+    asyncio.run(scenario())
+
+
+def test_scheduling_under_the_same_name_replaces_the_job():
+    async def scenario():
+        scheduler = PeriodicScheduler()
+        runs = []
+
+        async def first():
+            runs.append("first")
+
+        async def second():
+            runs.append("second")
+        scheduler.schedule("job", first, 0.01)
+        await asyncio.sleep(0.03)
+        scheduler.schedule("job", second, 0.01)
+        await asyncio.sleep(0.01)
+        replaced_at = len(runs)
+        try:
+            assert await eventually(lambda: runs.count("second") >= 3)
+            assert "first" not in runs[replaced_at:]
+        finally:
+            scheduler.cancel_all()
+    asyncio.run(scenario())
+
+
+def test_run_blocking_keeps_the_loop_running():
+    async def scenario():
+        release = threading.Event()
+        blocked = asyncio.create_task(run_blocking(release.wait, 2.0))
+        # the loop still serves other tasks while the call blocks its executor thread
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        release.set()
+        assert await blocked is True
+    asyncio.run(scenario())
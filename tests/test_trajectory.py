@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from odrivemotor.src.odriveCAN.trajectory import parse_rate, parse_waypoints, plan_profile
+
+RATE = 1000.0
+
+
+def check_limits(profile, vel_limit, accel_limit):
+    assert np.all(np.abs(profile.velocity) <= vel_limit + 1e-9)
+    assert np.all(np.abs(profile.acceleration) <= accel_limit + 1e-9)
+    # the sampled position follows the sampled velocity
+    assert np.allclose(np.diff(profile.position), (profile.velocity[:-1] + profile.velocity[1:]) / 2 / RATE, atol=1e-3)
+
+
+def test_single_move_ends_at_rest_on_the_waypoint():
+    profile = plan_profile(1.0, [(5.0, 2.0, 4.0)], RATE)
+    assert profile.position[0] == 1.0 and profile.velocity[0] == 0.0
+    assert profile.position[-1] == 5.0 and profile.velocity[-1] == 0.0
+    # 0.5s to accelerate to 2 rev/s, 1.5s cruising and 0.5s to stop
+    assert profile.duration == pytest.approx(2.5)
+    assert np.max(profile.velocity) == pytest.approx(2.0)
+    check_limits(profile, 2.0, 4.0)
+
+
+def test_short_move_never_reaches_its_velocity_limit():
+    profile = plan_profile(0.0, [(-1.0, 10.0, 4.0)], RATE)
+    assert profile.position[-1] == -1.0
+    assert np.min(profile.velocity) == pytest.approx(-2.0, abs=1e-2)
+    assert profile.duration == pytest.approx(1.0)
+    check_limits(profile, 10.0, 4.0)
+
+
+def test_waypoints_in_the_same_direction_are_passed_without_stopping():
+    profile = plan_profile(0.0, [(2.0, 1.0, 2.0), (4.0, 1.0, 2.0)], RATE)
+    passing = np.argmin(np.abs(profile.position - 2.0))
+    assert profile.velocity[passing] == pytest.approx(1.0, abs=1e-2)
+    check_limits(profile, 1.0, 2.0)
+
+
+def test_reversal_stops_at_the_waypoint():
+    profile = plan_profile(0.0, [(2.0, 1.0, 2.0), (0.5, 1.0, 2.0)], RATE)
+    turn = np.argmax(profile.position)
+    assert profile.position[turn] == pytest.approx(2.0, abs=1e-6)
+    assert profile.velocity[turn] == pytest.approx(0.0, abs=1e-2)
+    assert profile.position[-1] == 0.5
+    check_limits(profile, 1.0, 2.0)
+
+
+def test_per_segment_limits():
+    profile = plan_profile(0.0, [(4.0, 2.0, 2.0), (8.0, 1.0, 2.0)], RATE)
+    second = profile.position > 4.0 + 1e-6
+    assert np.all(np.abs(profile.velocity[second]) <= 1.0 + 1e-9)
+    check_limits(profile, 2.0, 2.0)
+
+
+def test_no_motion():
+    profile = plan_profile(3.0, [(3.0, 1.0, 1.0)], RATE)
+    assert profile.duration == 0.0
+    assert list(profile.position) == [3.0]
+
+
+def test_parse_waypoints():
+    assert parse_waypoints([1, {"position": 2, "rpm": 30}], rpm=60, rpm_per_sec=120) == [(1.0, 1.0, 2.0), (2.0, 0.5, 2.0)]
+    with pytest.raises(ValueError):
+        parse_waypoints([1], rpm=60)
+    with pytest.raises(ValueError):
+        parse_waypoints([{"position": 1, "rpm": 0}], rpm=60, rpm_per_sec=60)
+    with pytest.raises(ValueError):
+        parse_waypoints([], rpm=60, rpm_per_sec=60)
+
+
+@pytest.mark.parametrize("rate", [0, -100, float("inf"), float("nan"), True, "100"])
+def test_rate_must_be_a_positive_number(rate):
+    with pytest.raises(ValueError):
+        parse_rate(rate)
+    with pytest.raises(ValueError):
+        plan_profile(0.0, [(10.0, 1.0, 1.0)], rate)
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from benchmarks.fake_fibre import FakeODrive
+from benchmarks.simulator import POSITION_CONTROL, VELOCITY_CONTROL
+from odrivemotor.src.utils import parse_baud_rate, set_configs
+
+CONFIG = {
+    "axis0": {
+        "config": {"motor": {"torque_constant": 0.05}, "can": {"node_id": 3}, "general_lockin": {"current": None}},
+        "controller": {"config": {"control_mode": VELOCITY_CONTROL, "input_mode": 1}},
+        "trap_traj": {"config": {"vel_limit": 2.0}},
+    },
+}
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "odrive-config.json"
+    path.write_text(json.dumps(CONFIG))
+    return str(path)
+
+
+def test_set_configs_writes_only_changed_values(config_path):
+    odrv = FakeODrive(latency=0.0)
+    # torque_constant, node_id and control_mode differ; input_mode and vel_limit already match
+    assert set_configs(odrv, config_path) == 3
+    assert odrv.values["axis0.config.motor.torque_constant"] == 0.05
+    assert odrv.values["axis0.config.can.node_id"] == 3
+    assert odrv.axis.control_mode == VELOCITY_CONTROL
+    # the null a backup holds for an unreadable value is left alone
+    assert odrv.values["axis0.config.general_lockin.current"] == 10.0
+
+    assert set_configs(odrv, config_path) == 0
+    # a change made behind the module's back is undone by the next apply
+    odrv.axis.control_mode = POSITION_CONTROL
+    assert set_configs(odrv, config_path) == 1
+    assert odrv.axis.control_mode == VELOCITY_CONTROL
+
+
+def test_set_configs_compares_floats_with_a_tolerance(config_path):
+    odrv = FakeODrive(latency=0.0)
+    set_configs(odrv, config_path)
+    # the ODrive stores float32, so a value read back is not bit for bit the one in the file
+    odrv.values["axis0.config.motor.torque_constant"] = 0.05000000074505806
+    assert set_configs(odrv, config_path) == 0
+
+
+@pytest.mark.parametrize("baud_rate, expected", [("250000", 250000), ("250k", 250000), ("250 kbps", 250000), ("1M", 1000000), ("1Mbps", 1000000)])
+def test_parse_baud_rate(baud_rate, expected):
+    assert parse_baud_rate(baud_rate) == expected
+
+
+@pytest.mark.parametrize("baud_rate", ["", "fast", "0", "-250k", "1.5", "nan", "inf"])
+def test_parse_baud_rate_rejects_what_is_not_a_bit_rate(baud_rate):
+    with pytest.raises(ValueError):
+        parse_baud_rate(baud_rate)